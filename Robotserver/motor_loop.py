@@ -0,0 +1,155 @@
+import math
+import threading
+import time
+
+# Control loop parameters
+LOOP_RATE = 100          # Hz
+ACCEL_LIMIT = 200.0      # Max duty cycle change per second (0 -> 100% in 0.5 s)
+MAX_DUTY = 100.0         # Duty cycle at full setpoint
+SETPOINT_TIMEOUT = 0.5   # Seconds without a velocity setpoint before ramping to a stop
+
+
+def setpoint_value(value):
+    """A velocity component as a float; ValueError unless it's a finite number"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(f"velocity must be a number, got {value!r}")
+    return float(value)
+
+
+def mix(linear, angular):
+    """Map linear/angular velocity (-1..1) to left/right wheel speeds (-1..1)
+
+    Positive angular turns left. If a wheel would exceed full speed both are
+    scaled down together so the turn radius is preserved.
+    """
+    left = linear - angular
+    right = linear + angular
+    largest = max(abs(left), abs(right), 1.0)
+    return left / largest, right / largest
+
+
+class MotorControlLoop:
+    """Fixed-rate loop that ramps wheel duty cycles toward velocity setpoints
+
+    Messages only change the setpoint; PWM is written on loop ticks only, so
+    how the robot moves no longer depends on when messages happen to arrive.
+    write(left_duty, right_duty) receives signed duty cycles in -100..100.
+    """
+
+    def __init__(self, write, rate=LOOP_RATE, accel_limit=ACCEL_LIMIT,
+                 max_duty=MAX_DUTY, setpoint_timeout=SETPOINT_TIMEOUT):
+        self.write = write
+        self.period = 1.0 / rate
+        self.accel_limit = accel_limit
+        self.max_duty = max_duty
+        self.setpoint_timeout = setpoint_timeout
+
+        # (linear, angular, hold, time set); replaced as a whole so the loop
+        # always reads a consistent setpoint without locking
+        self.setpoint = (0.0, 0.0, True, time.monotonic())
+        self.duty = (0.0, 0.0)
+        self.write_lock = threading.Lock()
+        self.thread = None
+        self.running = False
+        self.reset_stats()
+
+    def set_velocity(self, linear, angular, hold=False):
+        """Set the velocity setpoint (-1..1 each)
+
+        Setpoints expire after setpoint_timeout unless hold is True, so a
+        client that streams setpoints stops the robot by simply going quiet.
+        """
+        linear = max(-1.0, min(1.0, setpoint_value(linear)))
+        angular = max(-1.0, min(1.0, setpoint_value(angular)))
+        self.setpoint = (linear, angular, hold, time.monotonic())
+
+    def stop_now(self):
+        """Zero the setpoint and the output immediately, bypassing the ramp"""
+        self.setpoint = (0.0, 0.0, True, time.monotonic())
+        with self.write_lock:
+            self.duty = (0.0, 0.0)
+            self.write(0.0, 0.0)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='MotorControlLoop', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        self.stop_now()
+
+    def reset_stats(self):
+        self.ticks = 0
+        self.overruns = 0
+        self.period_sum = 0.0
+        self.period_max = 0.0
+        self.jitter_sum = 0.0
+        self.jitter_max = 0.0
+
+    def stats(self):
+        """Loop timing since the last reset, in milliseconds"""
+        periods = max(self.ticks - 1, 1)
+        return {
+            "rate_hz": round(1.0 / self.period),
+            "ticks": self.ticks,
+            "overruns": self.overruns,
+            "period_mean_ms": round(1000 * self.period_sum / periods, 3),
+            "period_max_ms": round(1000 * self.period_max, 3),
+            "jitter_mean_ms": round(1000 * self.jitter_sum / periods, 3),
+            "jitter_max_ms": round(1000 * self.jitter_max, 3),
+            "duty": {"left": round(self.duty[0], 1), "right": round(self.duty[1], 1)},
+        }
+
+    def _target(self, now):
+        linear, angular, hold, set_at = self.setpoint
+        if not hold and now - set_at > self.setpoint_timeout:
+            return 0.0, 0.0
+        left, right = mix(linear, angular)
+        return left * self.max_duty, right * self.max_duty
+
+    def _ramp(self, current, target, max_step):
+        if target > current:
+            return min(target, current + max_step)
+        return max(target, current - max_step)
+
+    def _run(self):
+        next_tick = time.perf_counter()
+        last_tick = None
+        while self.running:
+            now = time.perf_counter()
+
+            # Timing instrumentation
+            if last_tick is not None:
+                period = now - last_tick
+                self.period_sum += period
+                self.period_max = max(self.period_max, period)
+                jitter = abs(period - self.period)
+                self.jitter_sum += jitter
+                self.jitter_max = max(self.jitter_max, jitter)
+            last_tick = now
+            self.ticks += 1
+
+            # Ramp toward the target within the acceleration limit
+            target_left, target_right = self._target(time.monotonic())
+            max_step = self.accel_limit * self.period
+            with self.write_lock:
+                left, right = self.duty
+                new_left = self._ramp(left, target_left, max_step)
+                new_right = self._ramp(right, target_right, max_step)
+                if (new_left, new_right) != self.duty:
+                    self.duty = (new_left, new_right)
+                    self.write(new_left, new_right)
+
+            # Sleep until the next deadline; if we missed one, count an
+            # overrun and re-anchor instead of firing a burst of late ticks
+            next_tick += self.period
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif -delay > self.period:
+                self.overruns += int(math.floor(-delay / self.period))
+                next_tick = time.perf_counter()
@@ -0,0 +1,97 @@
+import asyncio
+import collections
+import time
+
+# Outbound priority classes, highest first
+CONTROL = 0    # Command acks and errors
+STATE = 1      # Connection state, signaling answers and candidates
+TELEMETRY = 2  # Periodic sensor readings
+BULK = 3       # Anything large that can wait
+
+PRIORITY_NAMES = {CONTROL: "control", STATE: "state", TELEMETRY: "telemetry", BULK: "bulk"}
+
+# Messages queued per class; when a class is full its oldest message is dropped
+DEFAULT_LIMITS = {CONTROL: 256, STATE: 64, TELEMETRY: 4, BULK: 16}
+
+# Seconds after which a queued message is no longer worth sending
+DEFAULT_MAX_AGE = {TELEMETRY: 2.0}
+
+
+class OutboundScheduler:
+    """Per-connection send queue that always sends the highest priority first
+
+    All sends for a connection go through put(), and one task writes them to
+    the socket, so a burst of telemetry can delay an ack by at most the one
+    message already being written.
+    """
+
+    def __init__(self, send, limits=DEFAULT_LIMITS, max_age=DEFAULT_MAX_AGE):
+        self.send = send  # coroutine function taking one message
+        self.limits = limits
+        self.max_age = max_age
+        self.queues = {priority: collections.deque() for priority in PRIORITY_NAMES}
+        self.dropped = {priority: 0 for priority in PRIORITY_NAMES}
+        self.stale = {priority: 0 for priority in PRIORITY_NAMES}
+        self.sent = {priority: 0 for priority in PRIORITY_NAMES}
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.ensure_future(self._run())
+        return self
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except (asyncio.CancelledError, Exception):
+                # The socket may already have closed under a pending send
+                pass
+            self.task = None
+
+    def put(self, message, priority=CONTROL):
+        """Queue a message; never blocks"""
+        queue = self.queues[priority]
+        if len(queue) >= self.limits[priority]:
+            queue.popleft()
+            self.dropped[priority] += 1
+        queue.append((time.monotonic(), message))
+        self.wakeup.set()
+
+    def pending(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+    def stats(self):
+        return {
+            PRIORITY_NAMES[priority]: {
+                "queued": len(self.queues[priority]),
+                "sent": self.sent[priority],
+                "dropped": self.dropped[priority],
+                "stale": self.stale[priority],
+            }
+            for priority in PRIORITY_NAMES
+        }
+
+    def _next(self):
+        """Pop the next message to send, skipping stale ones"""
+        now = time.monotonic()
+        for priority, queue in self.queues.items():
+            max_age = self.max_age.get(priority)
+            while queue:
+                queued_at, message = queue.popleft()
+                if max_age is not None and now - queued_at > max_age:
+                    self.stale[priority] += 1
+                    continue
+                return priority, message
+        return None, None
+
+    async def _run(self):
+        while True:
+            priority, message = self._next()
+            if message is None:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            await self.send(message)
+            self.sent[priority] += 1
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# outbound_bench.py
+# Show that command acks keep a flat latency while telemetry floods the link.
+# A fake socket sends at a fixed bandwidth; telemetry is pushed at increasing
+# rates while an ack is queued every 50 ms. Each rate is run twice: once with
+# everything in one FIFO (how claude_websocket used to send) and once through
+# OutboundScheduler.
+#
+#   python3 outbound_bench.py --bandwidth 200
+import argparse
+import asyncio
+import statistics
+import time
+
+from outbound import OutboundScheduler, CONTROL, TELEMETRY
+
+TELEMETRY_SIZE = 2048   # bytes per telemetry message
+ACK_INTERVAL = 0.05     # seconds between acks
+RUN_SECONDS = 3.0
+
+
+async def run(bandwidth, telemetry_rate, prioritized):
+    ack_sent_at = {}
+    latencies = []
+
+    async def send(message):
+        # Fake socket: writing takes as long as the link needs
+        await asyncio.sleep(len(message) / bandwidth)
+        if message in ack_sent_at:
+            latencies.append(time.perf_counter() - ack_sent_at.pop(message))
+
+    if prioritized:
+        outbound = OutboundScheduler(send).start()
+        ack_priority, telemetry_priority = CONTROL, TELEMETRY
+    else:
+        # One unbounded queue, in arrival order
+        outbound = OutboundScheduler(send, limits={p: 10 ** 9 for p in range(4)},
+                                     max_age={}).start()
+        ack_priority = telemetry_priority = CONTROL
+
+    async def flood():
+        payload = "t" * TELEMETRY_SIZE
+        while True:
+            outbound.put(payload, telemetry_priority)
+            await asyncio.sleep(1.0 / telemetry_rate)
+
+    flood_task = asyncio.ensure_future(flood())
+    start = time.perf_counter()
+    ack = 0
+    while time.perf_counter() - start < RUN_SECONDS:
+        message = f'{{"status": "ok", "ack": {ack}}}'
+        ack_sent_at[message] = time.perf_counter()
+        outbound.put(message, ack_priority)
+        ack += 1
+        await asyncio.sleep(ACK_INTERVAL)
+    await asyncio.sleep(0.2)
+
+    flood_task.cancel()
+    stats = outbound.stats()
+    await outbound.stop()
+    delivered = len(latencies)
+    median = statistics.median(latencies) * 1000 if latencies else float('nan')
+    worst = max(latencies) * 1000 if latencies else float('nan')
+    return delivered, ack, median, worst, stats["telemetry"]
+
+
+async def main(bandwidth_kb):
+    bandwidth = bandwidth_kb * 1024
+    link_rate = bandwidth / TELEMETRY_SIZE
+    print(f"Link: {bandwidth_kb} KB/s (~{link_rate:.0f} telemetry messages/s)")
+    print("%-10s %-12s %10s %14s %12s %22s" % (
+        "telemetry", "mode", "acks", "ack median ms", "ack max ms", "telemetry sent/dropped"))
+    for factor in (0.5, 1, 2, 4):
+        rate = link_rate * factor
+        for prioritized in (False, True):
+            delivered, total, median, worst, telemetry = await run(bandwidth, rate, prioritized)
+            mode = "priority" if prioritized else "fifo"
+            if prioritized:
+                dropped = telemetry["dropped"] + telemetry["stale"]
+                telemetry_column = f"{telemetry['sent']}/{dropped}"
+            else:
+                telemetry_column = "-"
+            print("%-10s %-12s %10s %14.1f %12.1f %22s" % (
+                f"{factor:g}x link", mode, f"{delivered}/{total}", median, worst,
+                telemetry_column))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ack latency under a telemetry flood")
+    parser.add_argument("--bandwidth", type=float, default=200, help="Link bandwidth in KB/s")
+    args = parser.parse_args()
+    asyncio.run(main(args.bandwidth))
@@ -0,0 +1,163 @@
+import os
+import time
+
+# PWM backend setup
+# Motor speed pins can be driven by the kernel's hardware PWM through
+# /sys/class/pwm, or by RPi.GPIO's software PWM (a busy thread per pin that
+# jitters under load and tops out around a few hundred Hz). Both expose the
+# RPi.GPIO PWM interface: start(), ChangeDutyCycle(), ChangeFrequency(), stop().
+#
+# Pins with a hardware channel use it when the channel is exported or can be;
+# everything else falls back to software PWM. Choose per pin with
+# ROBOT_PWM="18=sysfs,17=software" or "18=sysfs:0:1" for an explicit
+# pwmchip:channel. Hardware PWM needs the pwm overlay enabled, e.g.
+# dtoverlay=pwm-2chan on a Raspberry Pi or jetson-io on a Jetson.
+SYSFS_ROOT = '/sys/class/pwm'
+EXPORT_TIMEOUT = 1.0  # Seconds to wait for udev to make a new channel writable
+
+# BCM pin -> (pwmchip, channel)
+PI_CHANNELS = {12: (0, 0), 18: (0, 0), 13: (0, 1), 19: (0, 1)}
+JETSON_NANO_CHANNELS = {12: (0, 0), 13: (0, 2)}
+
+
+def board_channels():
+    """Hardware PWM channels of the board this runs on"""
+    try:
+        with open('/proc/device-tree/model') as f:
+            model = f.read()
+    except OSError:
+        model = ''
+    return JETSON_NANO_CHANNELS if 'Jetson' in model else PI_CHANNELS
+
+
+def backends_from_env(default=''):
+    """Parse ROBOT_PWM into {pin: (backend, chip, channel)}"""
+    value = os.environ.get('ROBOT_PWM', default)
+    backends = {}
+    for entry in value.split(','):
+        if not entry.strip():
+            continue
+        pin, _, spec = entry.partition('=')
+        parts = spec.strip().split(':')
+        chip = int(parts[1]) if len(parts) > 1 else None
+        channel = int(parts[2]) if len(parts) > 2 else None
+        backends[int(pin)] = (parts[0], chip, channel)
+    return backends
+
+
+class SysfsPWM:
+    """Hardware PWM channel through /sys/class/pwm/pwmchipN/pwmM"""
+
+    backend = 'sysfs'
+
+    def __init__(self, chip, channel, frequency, sysfs_root=SYSFS_ROOT):
+        self.chip_path = os.path.join(sysfs_root, f'pwmchip{chip}')
+        self.path = os.path.join(self.chip_path, f'pwm{channel}')
+        self.channel = channel
+        self.period_ns = 0
+        self.duty = 0
+        self._export()
+        self.ChangeFrequency(frequency)
+
+    def _export(self):
+        if not os.path.isdir(self.chip_path):
+            raise OSError(f"No PWM chip at {self.chip_path}")
+        if not os.path.isdir(self.path):
+            with open(os.path.join(self.chip_path, 'export'), 'w') as f:
+                f.write(str(self.channel))
+        # The channel directory can appear before udev has made its files
+        # writable
+        deadline = time.monotonic() + EXPORT_TIMEOUT
+        while not os.access(os.path.join(self.path, 'enable'), os.W_OK):
+            if time.monotonic() > deadline:
+                raise OSError(f"{self.path} is not writable")
+            time.sleep(0.01)
+
+    def _write(self, name, value):
+        # Like echo: the kernel takes each write as the whole value
+        with open(os.path.join(self.path, name), 'w') as f:
+            f.write(str(value))
+
+    def start(self, duty):
+        self.ChangeDutyCycle(duty)
+        self._write('enable', 1)
+
+    def ChangeDutyCycle(self, duty):
+        duty = min(max(duty, 0), 100)
+        if duty == self.duty:
+            return
+        self.duty = duty
+        self._write('duty_cycle', int(self.period_ns * duty / 100))
+
+    def ChangeFrequency(self, frequency):
+        period_ns = int(1e9 / frequency)
+        if period_ns == self.period_ns:
+            return
+        # The kernel rejects a duty cycle longer than the period, so shrink
+        # the duty cycle before the period and grow it after
+        duty = self.duty
+        self._write('duty_cycle', 0)
+        self._write('period', period_ns)
+        self.period_ns = period_ns
+        self.duty = 0
+        self.ChangeDutyCycle(duty)
+
+    def stop(self):
+        self._write('enable', 0)
+
+
+class SoftwarePWM:
+    """RPi.GPIO software PWM on any output pin"""
+
+    backend = 'software'
+
+    def __init__(self, pin, frequency, gpio=None):
+        if gpio is None:
+            import RPi.GPIO as gpio
+        gpio.setup(pin, gpio.OUT)
+        self.pwm = gpio.PWM(pin, frequency)
+        self.duty = 0
+
+    def start(self, duty):
+        self.duty = duty
+        self.pwm.start(duty)
+
+    def ChangeDutyCycle(self, duty):
+        duty = min(max(duty, 0), 100)
+        if duty == self.duty:
+            return
+        self.duty = duty
+        self.pwm.ChangeDutyCycle(duty)
+
+    def ChangeFrequency(self, frequency):
+        self.pwm.ChangeFrequency(frequency)
+
+    def stop(self):
+        self.pwm.stop()
+
+
+def create_pwm(pin, frequency, hardware_frequency=None, backends=None,
+               sysfs_root=SYSFS_ROOT, gpio=None):
+    """PWM for a BCM pin: hardware if configured and available, else software
+
+    hardware_frequency lets hardware channels run faster (e.g. 20 kHz, above
+    hearing) than software PWM can. The pin must not be set up as a GPIO
+    output first when it is used for hardware PWM: that takes it away from
+    the PWM peripheral.
+    """
+    backends = backends_from_env() if backends is None else backends
+    backend, chip, channel = backends.get(pin, ('auto', None, None))
+    if backend not in ('auto', 'sysfs', 'software'):
+        raise ValueError(f"Unknown PWM backend {backend} for pin {pin}")
+
+    if backend != 'software':
+        if chip is None:
+            chip, channel = board_channels().get(pin, (None, None))
+        if chip is not None:
+            try:
+                return SysfsPWM(chip, channel, hardware_frequency or frequency, sysfs_root)
+            except OSError as e:
+                print(f"Hardware PWM unavailable for pin {pin} ({e}); using software PWM")
+        elif backend == 'sysfs':
+            print(f"Pin {pin} has no hardware PWM channel; using software PWM")
+    return SoftwarePWM(pin, frequency, gpio)
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# pwm_bench.py
+# Check and measure the PWM backends in pwm_backend.py.
+#
+#   python3 pwm_bench.py --fake
+#       Drive SysfsPWM against a fake /sys/class/pwm tree in a temp folder
+#       (a thread plays the kernel and creates channels on export). It checks
+#       the period/duty_cycle/enable files and times duty updates. Needs no
+#       hardware.
+#
+#   sudo python3 pwm_bench.py --pin 18 --sense-pin 24 --load 3
+#       On the robot: run each backend on --pin at 50% and report its CPU
+#       cost and the measured duty cycle. Jumper --pin to --sense-pin, which
+#       is sampled as an input. --load starts busy processes (JPEG encoding,
+#       like the video server) to show jitter under load.
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import pwm_backend
+
+
+def fake_sysfs(root, chips=1, channels=2):
+    """Build a fake pwm class folder; returns a stop() for its kernel thread"""
+    for chip in range(chips):
+        chip_path = os.path.join(root, f'pwmchip{chip}')
+        os.makedirs(chip_path)
+        with open(os.path.join(chip_path, 'npwm'), 'w') as f:
+            f.write(str(channels))
+        open(os.path.join(chip_path, 'export'), 'w').close()
+
+    running = [True]
+
+    def kernel():
+        # Create a channel's files shortly after its number is written to export
+        while running[0]:
+            for chip in range(chips):
+                chip_path = os.path.join(root, f'pwmchip{chip}')
+                with open(os.path.join(chip_path, 'export')) as f:
+                    value = f.read().strip()
+                if value and not os.path.isdir(os.path.join(chip_path, f'pwm{value}')):
+                    time.sleep(0.02)
+                    path = os.path.join(chip_path, f'pwm{value}')
+                    os.makedirs(path)
+                    for name in ('period', 'duty_cycle', 'enable'):
+                        with open(os.path.join(path, name), 'w') as f:
+                            f.write('0')
+            time.sleep(0.005)
+
+    thread = threading.Thread(target=kernel, daemon=True)
+    thread.start()
+
+    def stop():
+        running[0] = False
+        thread.join()
+    return stop
+
+
+def read_value(path):
+    with open(path) as f:
+        return int(f.read().strip() or 0)
+
+
+def run_fake(updates):
+    failures = 0
+
+    def check(name, actual, expected):
+        nonlocal failures
+        ok = actual == expected
+        failures += not ok
+        print(f"  {'ok  ' if ok else 'FAIL'} {name}: {actual}" + ("" if ok else f" (expected {expected})"))
+
+    with tempfile.TemporaryDirectory() as root:
+        stop_kernel = fake_sysfs(root)
+        try:
+            print("SysfsPWM against a fake sysfs tree")
+            channel = os.path.join(root, 'pwmchip0', 'pwm1')
+            pwm = pwm_backend.create_pwm(13, 100, hardware_frequency=20000,
+                                         backends={13: ('sysfs', 0, 1)}, sysfs_root=root)
+            check("backend", pwm.backend, 'sysfs')
+            check("period (ns)", read_value(os.path.join(channel, 'period')), 50000)
+            pwm.start(25)
+            check("duty_cycle after start(25)", read_value(os.path.join(channel, 'duty_cycle')), 12500)
+            check("enable", read_value(os.path.join(channel, 'enable')), 1)
+            pwm.ChangeFrequency(1000)
+            check("period after ChangeFrequency(1000)", read_value(os.path.join(channel, 'period')), 1000000)
+            check("duty_cycle keeps 25%", read_value(os.path.join(channel, 'duty_cycle')), 250000)
+
+            start_cpu = time.process_time()
+            start = time.perf_counter()
+            for i in range(updates):
+                pwm.ChangeDutyCycle(i % 100 + 0.5)
+            elapsed = time.perf_counter() - start
+            cpu = time.process_time() - start_cpu
+            check("duty_cycle after updates", read_value(os.path.join(channel, 'duty_cycle')),
+                  int(1000000 * ((updates - 1) % 100 + 0.5) / 100))
+            pwm.stop()
+            check("enable after stop", read_value(os.path.join(channel, 'enable')), 0)
+            print(f"  {updates} duty updates: {elapsed / updates * 1e6:.1f} us each, "
+                  f"{cpu / updates * 1e6:.1f} us CPU each")
+
+            # An existing but unconfigured chip falls back to software PWM
+            print("Fallback")
+            fallback = pwm_backend.create_pwm(13, 100, backends={13: ('sysfs', 5, 0)},
+                                              sysfs_root=root, gpio=FakeGPIO())
+            check("missing chip falls back to", fallback.backend, 'software')
+        finally:
+            stop_kernel()
+    print("all checks passed" if not failures else f"{failures} checks failed")
+    return failures == 0
+
+
+class FakeGPIO:
+    """Records setup/PWM calls; only used for the fallback check"""
+    OUT = 'out'
+
+    def setup(self, pin, mode):
+        pass
+
+    class PWM:
+        def __init__(self, pin, frequency):
+            pass
+
+        def start(self, duty):
+            pass
+
+        def ChangeDutyCycle(self, duty):
+            pass
+
+        def ChangeFrequency(self, frequency):
+            pass
+
+        def stop(self):
+            pass
+
+
+def busy_encoder():
+    import cv2
+    import numpy as np
+    frame = np.random.randint(0, 255, (480, 640, 3), dtype=np.uint8)
+    while True:
+        cv2.imencode('.jpg', frame)
+
+
+def measure_duty(gpio, sense_pin, frequency, seconds):
+    """Sample the sense pin; returns the duty cycle measured over each 10 periods"""
+    window = 10.0 / frequency
+    duties = []
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        highs = samples = 0
+        window_end = time.perf_counter() + window
+        while time.perf_counter() < window_end:
+            highs += gpio.input(sense_pin)
+            samples += 1
+        duties.append(100.0 * highs / samples)
+    return duties
+
+
+def run_hardware(args):
+    import RPi.GPIO as GPIO
+
+    GPIO.setmode(GPIO.BCM)
+    GPIO.setup(args.sense_pin, GPIO.IN)
+    load = [multiprocessing.Process(target=busy_encoder, daemon=True) for _ in range(args.load)]
+    for process in load:
+        process.start()
+    print(f"pin {args.pin} at {args.duty}%, {args.frequency} Hz, {args.load} busy processes")
+    print("%-10s %12s %12s %10s %10s %10s" % (
+        "backend", "CPU % idle", "duty mean", "stdev", "min", "max"))
+    try:
+        for backend in args.backends.split(','):
+            pwm = pwm_backend.create_pwm(args.pin, args.frequency,
+                                         backends={args.pin: (backend, None, None)}, gpio=GPIO)
+            if pwm.backend != backend:
+                print(f"{backend:<10} not available on pin {args.pin}")
+                pwm.stop()
+                continue
+            pwm.start(args.duty)
+            time.sleep(0.5)
+            # CPU while nothing but the PWM runs in this process
+            start_cpu = time.process_time()
+            time.sleep(args.seconds)
+            cpu = 100.0 * (time.process_time() - start_cpu) / args.seconds
+            duties = measure_duty(GPIO, args.sense_pin, args.frequency, args.seconds)
+            pwm.stop()
+            print("%-10s %12.1f %12.2f %10.2f %10.1f %10.1f" % (
+                backend, cpu, statistics.mean(duties), statistics.pstdev(duties),
+                min(duties), max(duties)))
+    finally:
+        for process in load:
+            process.terminate()
+        GPIO.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='PWM backend checks and measurements')
+    parser.add_argument('--fake', action='store_true', help='Check SysfsPWM against a fake sysfs tree')
+    parser.add_argument('--updates', type=int, default=10000, help='Duty updates to time with --fake')
+    parser.add_argument('--pin', type=int, default=18, help='BCM pin to drive')
+    parser.add_argument('--sense-pin', type=int, default=24, help='BCM pin jumpered to --pin')
+    parser.add_argument('--backends', default='software,sysfs')
+    parser.add_argument('--frequency', type=int, default=100)
+    parser.add_argument('--duty', type=float, default=50)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--load', type=int, default=0, help='Busy processes to run alongside')
+    args = parser.parse_args()
+
+    if args.fake:
+        sys.exit(0 if run_fake(args.updates) else 1)
+    run_hardware(args)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# alloc_bench.py
+# Memory churn of the MJPEG hot path: capture, JPEG encode and multipart
+# framing for a few viewers, done the old way (new array per read, bytes copy
+# of the JPEG, one concatenated chunk per viewer) and the pooled way (read into
+# camera.FramePool, memoryview of the JPEG, header/payload/trailer written
+# separately). Each mode runs in its own process so RSS is comparable.
+#
+# Per frame it reports the most memory allocated on top of what was live when
+# the frame started (tracemalloc peak; numpy and OpenCV arrays are traced), and
+# for the run the steady-state RSS, how often the GC ran and how many arrays
+# the frame pool had to create.
+#
+#   python3 alloc_bench.py --frames 600 --viewers 4
+import argparse
+import gc
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+import camera
+
+WIDTH = 640
+HEIGHT = 480
+PART_HEADER = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+PART_END = b'\r\n'
+
+
+def write_source(path, count=90):
+    """Write a short MJPEG clip to read frames from, like a USB camera"""
+    rng = np.random.default_rng(0)
+    background = cv2.GaussianBlur(
+        rng.integers(0, 255, (HEIGHT, WIDTH * 2, 3), dtype=np.uint8), (0, 0), 6)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 30, (WIDTH, HEIGHT))
+    for i in range(count):
+        x = (i * 4) % WIDTH
+        writer.write(np.ascontiguousarray(background[:, x:x + WIDTH]))
+    writer.release()
+
+
+def rss_bytes():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+class Sink:
+    """Stands in for a viewer's socket; only counts what it is given"""
+
+    def __init__(self):
+        self.bytes = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+
+
+def copy_reader(cap):
+    return cap.read
+
+
+def pooled_reader(cap):
+    """Read like CameraStream._capture, into arrays from a FramePool; each
+    frame is held until released to read.pool"""
+    pool = camera.FramePool()
+    layout = []
+
+    def read():
+        buffer = pool.acquire(*layout) if layout else None
+        success, frame = cap.read(buffer)
+        if success and frame is not buffer:
+            pool.reset()
+            layout[:] = [frame.shape, frame.dtype]
+        elif not success and buffer is not None:
+            pool.release(buffer)
+        return success, frame
+
+    read.pool = pool
+    return read
+
+
+def serve_copy(jpeg_array, sinks):
+    jpeg = jpeg_array.tobytes()
+    for sink in sinks:
+        sink.write(PART_HEADER + jpeg + PART_END)
+
+
+def serve_pooled(jpeg_array, sinks):
+    jpeg = memoryview(jpeg_array)
+    for sink in sinks:
+        sink.write(PART_HEADER)
+        sink.write(jpeg)
+        sink.write(PART_END)
+
+
+def run(mode, source, frames, viewers):
+    cap = cv2.VideoCapture(source)
+    read = pooled_reader(cap) if mode == 'pooled' else copy_reader(cap)
+    serve = serve_pooled if mode == 'pooled' else serve_copy
+    release = read.pool.release if mode == 'pooled' else (lambda frame: None)
+    sinks = [Sink() for _ in range(viewers)]
+    collections = [0]
+    gc.callbacks.append(lambda phase, info: collections.__setitem__(
+        0, collections[0] + (phase == 'start')))
+
+    # Frames in flight, as the encode pool and H.264 queue would hold them
+    held = []
+    peaks = []
+    rss = []
+    tracemalloc.start()
+    start = time.perf_counter()
+    for i in range(frames):
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+
+        success, frame = read()
+        if not success:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            continue
+        held.append(frame)
+        if len(held) > camera.MAX_IN_FLIGHT:
+            release(held.pop(0))
+        ret, jpeg_array = cv2.imencode('.jpg', frame)
+        serve(jpeg_array, sinks)
+
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+        if i % 30 == 0:
+            rss.append(rss_bytes())
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+
+    steady = rss[len(rss) // 2:]
+    pool_arrays = read.pool.allocated if mode == 'pooled' else '-'
+    print(f"{mode}|{np.median(peaks) / 1024:.1f}|"
+          f"{np.median(steady) / 2 ** 20:.1f}|{max(steady) / 2 ** 20:.1f}|"
+          f"{collections[0]}|{frames / elapsed:.0f}|{pool_arrays}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Allocations in the MJPEG hot path')
+    parser.add_argument('--frames', type=int, default=600)
+    parser.add_argument('--viewers', type=int, default=4)
+    parser.add_argument('--mode', choices=['copy', 'pooled'], help='Run one mode (internal)')
+    parser.add_argument('--source', help='Clip to read (internal)')
+    args = parser.parse_args()
+
+    if args.mode:
+        run(args.mode, args.source, args.frames, args.viewers)
+        sys.exit(0)
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, 'source.avi')
+        write_source(source)
+        print(f"{args.frames} frames at {WIDTH}x{HEIGHT}, {args.viewers} viewers")
+        print("%-8s %16s %14s %12s %8s %6s %14s" % (
+            "mode", "alloc KB/frame", "steady RSS MB",
+            "max RSS MB", "GC runs", "fps", "pool arrays"))
+        for mode in ('copy', 'pooled'):
+            output = subprocess.run(
+                [sys.executable, __file__, '--mode', mode, '--source', source,
+                 '--frames', str(args.frames), '--viewers', str(args.viewers)],
+                check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+            values = output.strip().splitlines()[-1].split('|')
+            print("%-8s %16s %14s %12s %8s %6s %14s" % tuple(values))
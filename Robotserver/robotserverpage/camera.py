@@ -0,0 +1,444 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Camera registry setup
+# Cameras are configured by name. A source can be a device index, a device path,
+# a GStreamer pipeline string, or "test" for a moving test pattern (no camera
+# needed). Override with ROBOT_CAMERAS="front=0,rear=1".
+CAMERAS = {
+    "front": 0,
+    "rear": 1,
+}
+FRAME_WIDTH = 640
+FRAME_HEIGHT = 480
+
+# JPEG encoding runs in a pool shared by all cameras. cv2.imencode releases the
+# GIL, so a thread pool spreads the encodes across every core without paying to
+# copy frames into another process.
+ENCODE_WORKERS = os.cpu_count() or 4
+MAX_IN_FLIGHT = 2  # Per camera tier; further frames are skipped while the pool is busy
+
+encode_pool = ThreadPoolExecutor(max_workers=ENCODE_WORKERS)
+
+# Frames are read into a ring of preallocated arrays instead of a new array per
+# read. A frame can still be held by the encode pool or the H.264 encoder, so
+# the ring is sized to cover them.
+FRAME_POOL_SIZE = MAX_IN_FLIGHT + 4
+
+# Simulcast tiers setup
+# Each camera's stream comes in several sizes scaled from the one capture, and a
+# viewer picks one with /video_feed?tier=thumb. A tier is only encoded while it
+# has viewers or listeners, so a wall of thumbnails costs a fraction of a full
+# size stream. A tier is (width, JPEG quality); width 0 keeps the capture size
+# and the height follows the camera's aspect ratio. Override with
+# ROBOT_TIERS="full=0:95,small=320:70,thumb=160:50".
+TIERS = {
+    "full": (0, 95),  # 95 is OpenCV's default quality
+    "medium": (320, 75),
+    "thumb": (160, 60),
+}
+DEFAULT_TIER = "full"
+
+
+def cameras_from_env(default=CAMERAS):
+    """Parse ROBOT_CAMERAS into a {name: source} dict"""
+    value = os.environ.get('ROBOT_CAMERAS')
+    if not value:
+        return dict(default)
+    cameras = {}
+    for entry in value.split(','):
+        name, _, source = entry.partition('=')
+        source = source.strip()
+        cameras[name.strip()] = int(source) if source.isdigit() else source
+    return cameras
+
+
+def tiers_from_env(default=TIERS):
+    """Parse ROBOT_TIERS into a {name: (width, quality)} dict"""
+    value = os.environ.get('ROBOT_TIERS')
+    if not value:
+        return dict(default)
+    tiers = {}
+    for entry in value.split(','):
+        name, _, spec = entry.partition('=')
+        width, _, quality = spec.partition(':')
+        tiers[name.strip()] = (int(width or 0), int(quality or 95))
+    if DEFAULT_TIER not in tiers:
+        # Recorders and viewers without ?tier= use the default tier
+        tiers[DEFAULT_TIER] = default.get(DEFAULT_TIER, (0, 95))
+    return tiers
+
+
+class TestPatternCapture:
+    """Stands in for cv2.VideoCapture with a moving pattern at a fixed rate"""
+
+    def __init__(self, width=FRAME_WIDTH, height=FRAME_HEIGHT, fps=30):
+        import numpy as np
+
+        self.width = width
+        self.height = height
+        self.interval = 1.0 / fps
+        self.next_time = time.monotonic()
+        self.count = 0
+        # Smooth gradient background so the JPEGs are a realistic size
+        x = np.linspace(0, 255, width, dtype=np.float32)
+        y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+        self.background = np.dstack([x + 0 * y, y + 0 * x, (x + y) / 2]).astype(np.uint8)
+
+    def isOpened(self):
+        return True
+
+    def set(self, prop, value):
+        return False
+
+    def read(self, image=None):
+        import cv2
+        import numpy as np
+
+        delay = self.next_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self.next_time = max(self.next_time + self.interval, time.monotonic() - self.interval)
+
+        if image is None or image.shape != self.background.shape:
+            image = np.empty_like(self.background)
+        np.copyto(image, self.background)
+        self.count += 1
+        x = int(self.width / 2 + self.width / 3 * np.sin(self.count / 15))
+        cv2.rectangle(image, (x - 40, self.height // 2 - 40), (x + 40, self.height // 2 + 40),
+                      (40, 80, 220), -1)
+        cv2.putText(image, str(self.count), (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1,
+                    (255, 255, 255), 2)
+        return True, image
+
+    def release(self):
+        pass
+
+
+class FramePool:
+    """Ring of reusable frame arrays for VideoCapture.read()
+
+    An array comes back from acquire() held once, for the caller. Anyone else
+    who keeps it holds it too, and it is reused once every holder released it.
+    """
+
+    def __init__(self, size=FRAME_POOL_SIZE):
+        self.size = size
+        self.buffers = []
+        self.holds = {}  # id() of each array in the ring -> holders
+        self.lock = threading.Lock()
+        self.allocated = 0  # Arrays created, including ones outside the ring
+        self.next = 0
+
+    def acquire(self, shape, dtype):
+        """Return an array nobody holds, allocating only if there isn't one"""
+        import numpy as np
+
+        with self.lock:
+            for _ in range(len(self.buffers)):
+                buffer = self.buffers[self.next]
+                self.next = (self.next + 1) % len(self.buffers)
+                if not self.holds[id(buffer)] and buffer.shape == shape and buffer.dtype == dtype:
+                    self.holds[id(buffer)] = 1
+                    return buffer
+            buffer = np.empty(shape, dtype)
+            self.allocated += 1
+            if len(self.buffers) < self.size:
+                self.buffers.append(buffer)
+                self.holds[id(buffer)] = 1
+            return buffer
+
+    def hold(self, buffer):
+        """Keep an acquired array from being reused until release()"""
+        # Arrays from outside the ring (or from before a reset) aren't
+        # counted. The caller has a reference, so the id can't be a ring
+        # array's that was reused after the other one was freed.
+        with self.lock:
+            if id(buffer) in self.holds:
+                self.holds[id(buffer)] += 1
+
+    def release(self, buffer):
+        with self.lock:
+            if id(buffer) in self.holds:
+                self.holds[id(buffer)] -= 1
+
+    def reset(self):
+        with self.lock:
+            self.buffers = []
+            self.holds = {}
+            self.next = 0
+
+
+class StreamTier:
+    """One size and quality of a camera's JPEG stream"""
+
+    def __init__(self, name, width, quality):
+        self.name = name
+        self.width = width
+        self.quality = quality
+
+        # Latest encoded frame; viewers wait on the condition for a newer one
+        self.condition = threading.Condition()
+        self.jpeg = None
+        self.jpeg_seq = 0
+        self.viewers = 0
+        self.listeners = []  # Keep the tier encoding, like viewers
+        self.wakers = []     # Only told about new frames
+        self.in_flight = 0
+        self.encoded = 0
+        # Scaled copies are made into reused arrays, like captured frames, with
+        # room for a few halving steps (see scaled_buffers) per encode in flight
+        self.pool = FramePool(size=4 * (MAX_IN_FLIGHT + 1))
+        self.shape = None
+
+    def wanted(self):
+        return self.viewers or self.listeners
+
+    def scaled_buffers(self, frame):
+        """Free arrays to scale frame into, step by step, ending at this tier's
+        size; empty when the tier encodes frames as they are. Release them to
+        self.pool when done."""
+        if not self.width or self.width >= frame.shape[1]:
+            return []
+        height, width = frame.shape[:2]
+        # INTER_AREA halves an image several times faster than it scales by
+        # other ratios, so go down by halves and then to the tier's size
+        shapes = []
+        while width // 2 > self.width:
+            height, width = height // 2, width // 2
+            shapes.append((height, width) + frame.shape[2:])
+        # Even height, like camera modes
+        height = int(round(frame.shape[0] * self.width / frame.shape[1] / 2)) * 2
+        shapes.append((height, self.width) + frame.shape[2:])
+        if shapes[-1] != self.shape:
+            self.pool.reset()
+            self.shape = shapes[-1]
+        return [self.pool.acquire(shape, frame.dtype) for shape in shapes]
+
+    def publish(self, seq, jpeg):
+        with self.condition:
+            # Encodes can finish out of order; never go back in time
+            if seq <= self.jpeg_seq:
+                return
+            self.jpeg = jpeg
+            self.jpeg_seq = seq
+            self.encoded += 1
+            self.condition.notify_all()
+        for listener in self.listeners + self.wakers:
+            listener(jpeg)
+
+    def stats(self):
+        return {"width": self.width, "quality": self.quality, "viewers": self.viewers,
+                "encoded": self.encoded, "jpeg_bytes": len(self.jpeg) if self.jpeg is not None else 0}
+
+
+class CameraStream:
+    """Capture frames from one camera on its own thread and publish JPEG tiers"""
+
+    def __init__(self, name, source, width=FRAME_WIDTH, height=FRAME_HEIGHT, tiers=TIERS):
+        self.name = name
+        self.source = source
+        self.width = width
+        self.height = height
+        self.cap = None
+        self.thread = None
+        self.running = False
+        self.start_lock = threading.Lock()
+
+        self.tiers = {tier: StreamTier(tier, tier_width, quality)
+                      for tier, (tier_width, quality) in tiers.items()}
+        self.frame_listeners = []
+        self.pool = FramePool()
+
+    def start(self):
+        """Open the camera and start the capture thread, if not running yet"""
+        # Imported here so that importing this module stays cheap at startup
+        import cv2
+
+        with self.start_lock:
+            if self.running:
+                return True
+            if self.source == 'test':
+                self.cap = TestPatternCapture(self.width, self.height)
+            elif isinstance(self.source, str) and '!' in self.source:
+                self.cap = cv2.VideoCapture(self.source, cv2.CAP_GSTREAMER)
+            else:
+                self.cap = cv2.VideoCapture(self.source)
+            if not self.cap.isOpened():
+                print(f"Error: Could not open camera {self.name} ({self.source})")
+                return False
+
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+
+            self.running = True
+            self.thread = threading.Thread(target=self._capture,
+                                           name=f"Camera-{self.name}", daemon=True)
+            self.thread.start()
+            return True
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        if self.cap:
+            self.cap.release()
+        for tier in self.tiers.values():
+            with tier.condition:
+                tier.condition.notify_all()
+
+    def add_listener(self, callback, tier=DEFAULT_TIER, keep_encoding=True):
+        """Call callback(jpeg) for every frame encoded in a tier, e.g. a recorder
+
+        jpeg is a memoryview over the encoder's output array. It is never
+        reused, so it can be kept without copying; don't write to it. A
+        listener keeps its tier encoding even without viewers, unless
+        keep_encoding is False (for callbacks that only wake viewers).
+        """
+        stream_tier = self.tiers[tier]
+        if keep_encoding:
+            stream_tier.listeners.append(callback)
+        else:
+            stream_tier.wakers.append(callback)
+
+    def add_frame_listener(self, callback):
+        """Call callback(frame) with every raw BGR frame from the capture thread
+
+        The callback must not block or modify the frame. The frame's array is
+        reused for a later read once the callback returns, so a listener that
+        keeps it must hold_frame() it and release_frame() it when done.
+        """
+        self.frame_listeners = self.frame_listeners + [callback]
+
+    def remove_frame_listener(self, callback):
+        # Compared with != rather than "is not": a bound method is a new object
+        # on every attribute access, but equal to the others for the same object
+        self.frame_listeners = [c for c in self.frame_listeners if c != callback]
+
+    def hold_frame(self, frame):
+        self.pool.hold(frame)
+
+    def release_frame(self, frame):
+        self.pool.release(frame)
+
+    def tier_stats(self):
+        return {name: tier.stats() for name, tier in self.tiers.items()}
+
+    def _capture(self):
+        seq = 0
+        layout = None  # (shape, dtype) of the frames in the pool
+        while self.running:
+            # Decode straight into a free pooled array
+            buffer = self.pool.acquire(*layout) if layout else None
+            try:
+                success, frame = self.cap.read(buffer)
+                if success and frame is not buffer:
+                    # First frame, or the size changed: pool arrays like this one
+                    self.pool.reset()
+                    layout = (frame.shape, frame.dtype)
+                if not success:
+                    print(f"Warning: Could not read from camera {self.name}")
+                    time.sleep(0.1)
+                    continue
+                seq += 1
+
+                for listener in self.frame_listeners:
+                    listener(frame)
+
+                for tier in self.tiers.values():
+                    # Only encode a tier when someone is consuming it
+                    if not tier.wanted():
+                        continue
+                    with tier.condition:
+                        if tier.in_flight >= MAX_IN_FLIGHT:
+                            continue
+                        tier.in_flight += 1
+                    self.pool.hold(frame)
+                    encode_pool.submit(self._encode, tier, seq, frame, tier.scaled_buffers(frame))
+            finally:
+                # Consumers that kept the frame hold it themselves
+                if buffer is not None:
+                    self.pool.release(buffer)
+
+    def _encode(self, tier, seq, frame, steps):
+        import cv2
+
+        scaled = frame
+        try:
+            for step in steps:
+                # INTER_AREA averages the pixels behind each output pixel, so
+                # small tiers don't shimmer
+                cv2.resize(scaled, (step.shape[1], step.shape[0]), dst=step,
+                           interpolation=cv2.INTER_AREA)
+                scaled = step
+            ret, buffer = cv2.imencode('.jpg', scaled, [cv2.IMWRITE_JPEG_QUALITY, tier.quality])
+            if ret:
+                # Publish a view of the encoder's array rather than a bytes copy
+                tier.publish(seq, memoryview(buffer))
+        finally:
+            self.pool.release(frame)
+            for step in steps:
+                tier.pool.release(step)
+            with tier.condition:
+                tier.in_flight -= 1
+
+    def frames(self, timeout=2.0, wait=None, tier=DEFAULT_TIER):
+        """Yield each new JPEG (a memoryview) of a tier as it is published, until the camera stops
+
+        If given, wait(timeout) is used to sleep until the next frame instead of
+        the condition, for servers that must not block on a thread lock.
+        """
+        stream_tier = self.tiers[tier]
+        # The first viewer opens the camera if the warm-up hasn't yet
+        if not self.start():
+            return
+        with stream_tier.condition:
+            stream_tier.viewers += 1
+        try:
+            last_seq = 0
+            while self.running:
+                if wait is not None and stream_tier.jpeg_seq == last_seq:
+                    wait(timeout)
+                with stream_tier.condition:
+                    if wait is None and stream_tier.jpeg_seq == last_seq:
+                        stream_tier.condition.wait(timeout)
+                    if stream_tier.jpeg_seq == last_seq:
+                        continue
+                    jpeg, last_seq = stream_tier.jpeg, stream_tier.jpeg_seq
+                yield jpeg
+        finally:
+            with stream_tier.condition:
+                stream_tier.viewers -= 1
+
+
+class CameraRegistry:
+    """All configured cameras, looked up by name"""
+
+    def __init__(self, cameras, tiers=TIERS):
+        self.cameras = {name: CameraStream(name, source, tiers=tiers)
+                        for name, source in cameras.items()}
+
+    @property
+    def default(self):
+        """The first camera that is running, or the first configured one"""
+        for name, camera in self.cameras.items():
+            if camera.running:
+                return name
+        return next(iter(self.cameras))
+
+    def names(self):
+        return list(self.cameras)
+
+    def get(self, name):
+        return self.cameras.get(name)
+
+    def start(self):
+        """Start every camera; returns the names that opened"""
+        return [name for name, camera in self.cameras.items() if camera.start()]
+
+    def close(self):
+        for camera in self.cameras.values():
+            camera.stop()
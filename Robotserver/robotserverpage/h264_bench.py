@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# h264_bench.py
+# Compare the MJPEG and H.264 stream modes on synthetic footage: bytes per
+# second on the wire, encode CPU per frame and quality (PSNR against the
+# source). The footage is a textured background panning slowly with a moving
+# object and sensor noise, roughly what a driving robot sees.
+#
+#   python3 h264_bench.py --frames 300 --bitrate 800000 --gop 30
+import argparse
+import io
+import time
+
+import av
+import cv2
+import numpy as np
+
+import h264_stream
+
+WIDTH = 640
+HEIGHT = 480
+FRAMERATE = 30
+
+
+def synthetic_frames(count, width=WIDTH, height=HEIGHT, seed=0):
+    rng = np.random.default_rng(seed)
+    background = cv2.GaussianBlur(
+        rng.integers(0, 255, (height, width * 2, 3), dtype=np.uint8), (0, 0), 6)
+    background = cv2.normalize(background, None, 0, 255, cv2.NORM_MINMAX)
+    for i in range(count):
+        x = (i * 2) % width
+        frame = background[:, x:x + width].copy()
+        cx = int(width / 2 + width / 3 * np.sin(i / 20))
+        cv2.rectangle(frame, (cx - 40, 200), (cx + 40, 280), (40, 80, 220), -1)
+        noise = rng.integers(-6, 7, frame.shape, dtype=np.int16)
+        yield np.clip(frame.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def psnr(a, b):
+    mse = np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2)
+    return 99.0 if mse == 0 else 10 * np.log10(255 ** 2 / mse)
+
+
+def bench_mjpeg(frames, quality):
+    total_bytes = 0
+    cpu = 0.0
+    scores = []
+    for frame in frames:
+        start = time.process_time()
+        ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        cpu += time.process_time() - start
+        # Multipart framing as served by /video_feed
+        total_bytes += len(buffer) + len(b'--frame\r\nContent-Type: image/jpeg\r\n\r\n\r\n')
+        scores.append(psnr(frame, cv2.imdecode(buffer, cv2.IMREAD_COLOR)))
+    return total_bytes, cpu, float(np.mean(scores))
+
+
+def bench_h264(frames, settings):
+    encoder = h264_stream.FragmentedMP4Encoder(WIDTH, HEIGHT, settings)
+    fragments = []
+    cpu = 0.0
+    for i, frame in enumerate(frames):
+        start = time.process_time()
+        fragments += encoder.encode(frame, timestamp=i / FRAMERATE)
+        cpu += time.process_time() - start
+    start = time.process_time()
+    fragments += encoder.close()
+    cpu += time.process_time() - start
+
+    data = encoder.init_segment + b''.join(fragment for fragment, _ in fragments)
+    decoded = [f.to_ndarray(format='bgr24') for f in av.open(io.BytesIO(data)).decode(video=0)]
+    scores = [psnr(source, result) for source, result in zip(frames, decoded)]
+    return len(data), cpu, float(np.mean(scores))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='MJPEG vs H.264 stream cost')
+    parser.add_argument('--frames', type=int, default=300, help='Frames of footage')
+    parser.add_argument('--quality', type=int, default=95, help='JPEG quality (OpenCV default 95)')
+    parser.add_argument('--bitrate', type=int, default=h264_stream.H264_SETTINGS['bitrate'])
+    parser.add_argument('--gop', type=int, default=h264_stream.H264_SETTINGS['gop'])
+    parser.add_argument('--preset', default=h264_stream.H264_SETTINGS['preset'])
+    args = parser.parse_args()
+
+    settings = dict(h264_stream.H264_SETTINGS, bitrate=args.bitrate, gop=args.gop, preset=args.preset)
+    frames = list(synthetic_frames(args.frames))
+    seconds = args.frames / FRAMERATE
+
+    print(f"{args.frames} frames of {WIDTH}x{HEIGHT} synthetic footage at {FRAMERATE} fps")
+    print("%-28s %12s %16s %10s" % ("mode", "KB/s", "encode CPU ms", "PSNR dB"))
+    mjpeg = bench_mjpeg(frames, args.quality)
+    h264 = bench_h264(frames, settings)
+    for name, (total_bytes, cpu, score) in (
+            (f"MJPEG q={args.quality}", mjpeg),
+            (f"H.264 {args.bitrate // 1000}k gop={args.gop} {args.preset}", h264)):
+        print("%-28s %12.1f %16.2f %10.2f" % (
+            name, total_bytes / seconds / 1024, 1000 * cpu / args.frames, score))
+    print(f"MJPEG uses {mjpeg[0] / h264[0]:.1f}x the bandwidth of H.264")
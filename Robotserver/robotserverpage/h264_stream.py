@@ -0,0 +1,291 @@
+import queue
+import struct
+import threading
+import time
+from fractions import Fraction
+
+# H.264 streaming setup
+# Frames from the camera's capture thread are encoded with PyAV into
+# fragmented MP4 (one moof+mdat per frame), which a <video> element can play
+# straight from an HTTP response. One encoder runs per camera while it has
+# viewers; new viewers get the init segment and join at the next keyframe.
+H264_SETTINGS = {
+    "codec": "libx264",
+    "gop": 30,               # Frames between keyframes; also the worst-case join delay
+    "bitrate": 800000,       # Bits per second
+    "preset": "ultrafast",   # x264 speed/efficiency trade-off
+    "framerate": 30,
+}
+MOVFLAGS = "frag_keyframe+empty_moov+default_base_moof+frag_every_frame"
+FRAME_QUEUE_SIZE = 2  # Raw frames waiting for the encoder; older ones are dropped
+
+
+def available():
+    """Whether PyAV can be imported, i.e. whether H.264 streaming can work"""
+    try:
+        import av  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class FragmentedMP4Encoder:
+    """Encode BGR frames into an fMP4 init segment and per-frame fragments"""
+
+    def __init__(self, width, height, settings=H264_SETTINGS):
+        import av
+
+        self.buffer = bytearray()
+        self.container = av.open(self, mode="w", format="mp4", options={"movflags": MOVFLAGS})
+        self.stream = self.container.add_stream(settings["codec"], rate=settings["framerate"])
+        self.stream.width = width
+        self.stream.height = height
+        self.stream.pix_fmt = "yuv420p"
+        self.stream.bit_rate = settings["bitrate"]
+        self.stream.codec_context.gop_size = settings["gop"]
+        self.stream.codec_context.time_base = Fraction(1, 1000)
+        if settings["codec"] == "libx264":
+            self.stream.codec_context.options = {
+                "preset": settings["preset"],
+                "tune": "zerolatency",  # No B-frames or lookahead
+            }
+        self.start_time = None
+        self.keyframes = []  # is_keyframe of each muxed packet not yet seen as a fragment
+        self.init_segment = None
+        self.moof = None
+
+    def write(self, data):
+        # Called by the muxer; this object is the container's output file
+        self.buffer += data
+        return len(data)
+
+    def encode(self, frame, timestamp=None):
+        """Encode one frame; returns a list of (fragment_bytes, is_keyframe)"""
+        import av
+
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        if self.start_time is None:
+            self.start_time = timestamp
+        video_frame = av.VideoFrame.from_ndarray(frame, format="bgr24")
+        video_frame.pts = int((timestamp - self.start_time) * 1000)
+        video_frame.time_base = Fraction(1, 1000)
+        for packet in self.stream.encode(video_frame):
+            self.keyframes.append(packet.is_keyframe)
+            self.container.mux(packet)
+        return self._fragments()
+
+    def close(self):
+        """Flush the encoder; returns the remaining fragments"""
+        for packet in self.stream.encode(None):
+            self.keyframes.append(packet.is_keyframe)
+            self.container.mux(packet)
+        self.container.close()
+        return self._fragments()
+
+    def _fragments(self):
+        """Split complete top-level MP4 boxes off the output buffer"""
+        fragments = []
+        offset = 0
+        while len(self.buffer) - offset >= 8:
+            size, box = struct.unpack_from(">I4s", self.buffer, offset)
+            if len(self.buffer) - offset < size:
+                break
+            data = bytes(self.buffer[offset:offset + size])
+            offset += size
+
+            if box in (b"ftyp", b"moov"):
+                self.init_segment = (self.init_segment or b"") + data
+            elif box == b"moof":
+                self.moof = data
+            elif box == b"mdat" and self.moof is not None:
+                is_keyframe = self.keyframes.pop(0) if self.keyframes else False
+                fragments.append((self.moof + data, is_keyframe))
+                self.moof = None
+        del self.buffer[:offset]
+        return fragments
+
+
+class H264Stream:
+    """Shared H.264 encoder for one camera, running while it has viewers"""
+
+    def __init__(self, camera_stream, settings=H264_SETTINGS):
+        self.camera_stream = camera_stream
+        self.settings = settings
+        self.frames = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+        self.condition = threading.Condition()
+        self.init_segment = None
+        self.fragments = []      # (seq, bytes, is_keyframe), trimmed to the last GOP
+        self.fragment_seq = 0
+        self.viewers = 0
+        self.thread = None
+        self.stopping = None
+        self.failed = False      # The current run's encoder raised; viewers give up
+        self.listeners = []
+
+    def add_listener(self, callback):
+        """Call callback() from the encoder thread whenever fragments are published"""
+        self.listeners.append(callback)
+
+    def _notify(self):
+        for listener in self.listeners:
+            listener()
+
+    def _on_frame(self, frame):
+        # Called from the capture thread; never block it
+        self.camera_stream.hold_frame(frame)
+        try:
+            self.frames.put_nowait(frame)
+        except queue.Full:
+            self.camera_stream.release_frame(frame)
+
+    def _start(self):
+        # Called with the condition held. Each run gets its own queue and stop
+        # event so a stopping encoder can't eat frames (or the stop marker)
+        # meant for the next one
+        self.init_segment = None
+        self.fragments = []
+        self.failed = False
+        self.frames = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(self.frames, self.stopping),
+                                       name=f"H264-{self.camera_stream.name}", daemon=True)
+        self.thread.start()
+        self.camera_stream.add_frame_listener(self._on_frame)
+
+    def _detach(self):
+        """Stop feeding the current run; call with the condition held and pass
+        the result to _stop() once it is released"""
+        self.camera_stream.remove_frame_listener(self._on_frame)
+        return self.frames, self.stopping
+
+    def _stop(self, frames, stopping):
+        """Tell a run's encoder thread to finish, without blocking
+
+        The encoder needs the condition to publish, and its queue can be full
+        while it encodes, so a blocking put here could wait on it forever.
+        """
+        stopping.set()
+        # Make room for the marker that wakes an encoder waiting for a frame
+        self._drain(frames)
+        try:
+            frames.put_nowait(None)
+        except queue.Full:
+            # A late frame got in first; the encoder sees stopping after it
+            pass
+
+    def _drain(self, frames):
+        """Empty a run's queue, giving the frames back to the camera"""
+        try:
+            while True:
+                frame = frames.get_nowait()
+                if frame is not None:
+                    self.camera_stream.release_frame(frame)
+        except queue.Empty:
+            pass
+
+    def _run(self, frames, stopping):
+        encoder = None
+        failed = False
+        try:
+            while not stopping.is_set():
+                frame = frames.get()
+                if frame is None:
+                    break
+                try:
+                    if stopping.is_set():
+                        break
+                    if encoder is None:
+                        height, width = frame.shape[:2]
+                        encoder = FragmentedMP4Encoder(width, height, self.settings)
+                    self._publish(encoder, encoder.encode(frame))
+                finally:
+                    self.camera_stream.release_frame(frame)
+        except Exception as e:
+            print(f"Error encoding H.264 for camera {self.camera_stream.name}: {e}")
+            failed = True
+        finally:
+            # Frames that came in after the stop marker, or after a failure
+            self._drain(frames)
+            with self.condition:
+                if self.thread is threading.current_thread():
+                    self.init_segment = None
+                    self.fragments = []
+                    if failed:
+                        # Nothing will be published for this run's viewers;
+                        # the next subscriber starts a new one
+                        self.failed = True
+                        self.camera_stream.remove_frame_listener(self._on_frame)
+                self.condition.notify_all()
+            self._notify()
+
+    def _publish(self, encoder, fragments):
+        with self.condition:
+            self.init_segment = encoder.init_segment
+            for data, is_keyframe in fragments:
+                self.fragment_seq += 1
+                if is_keyframe:
+                    self.fragments = []
+                self.fragments.append((self.fragment_seq, data, is_keyframe))
+            if fragments:
+                self.condition.notify_all()
+        if fragments:
+            self._notify()
+
+    def subscribe(self, timeout=5.0, wait=None):
+        """Yield the init segment and then fragments, starting at a keyframe
+
+        wait(timeout) replaces waiting on the condition, as in CameraStream.frames().
+        """
+        with self.condition:
+            self.viewers += 1
+            if self.viewers == 1 or self.failed:
+                self.camera_stream.start()
+                self._start()
+        try:
+            last_seq = None
+            while self.camera_stream.running and not self.failed:
+                if wait is not None and not self._has_new(last_seq):
+                    wait(timeout)
+                    if not self._has_new(last_seq):
+                        continue
+                with self.condition:
+                    if last_seq is None:
+                        # Join at the most recent keyframe
+                        if not self._has_new(last_seq):
+                            if wait is None:
+                                self.condition.wait(timeout)
+                            continue
+                        pending = list(self.fragments)
+                        init_segment = self.init_segment
+                    else:
+                        pending = [f for f in self.fragments if f[0] > last_seq]
+                        if not pending:
+                            if wait is None:
+                                self.condition.wait(timeout)
+                            continue
+                        if pending[0][0] != last_seq + 1:
+                            # Fell behind by more than a GOP; rejoin at the keyframe
+                            pending = list(self.fragments)
+                        init_segment = None
+
+                if init_segment:
+                    yield init_segment
+                for seq, data, _ in pending:
+                    yield data
+                last_seq = pending[-1][0]
+        finally:
+            run = None
+            with self.condition:
+                self.viewers -= 1
+                if self.viewers == 0:
+                    run = self._detach()
+            # Outside the condition, which the encoder thread may be waiting for
+            if run is not None:
+                self._stop(*run)
+
+    def _has_new(self, last_seq):
+        """Whether a viewer at last_seq (None before joining) has anything to send"""
+        fragments = self.fragments
+        if last_seq is None:
+            return bool(self.init_segment and fragments and fragments[0][2])
+        return bool(fragments) and fragments[-1][0] > last_seq
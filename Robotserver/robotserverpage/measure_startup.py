@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# measure_startup.py
+# Launch server.py and report the time from process start to the first
+# HTTP 200 on the control page. Run from this folder:
+#   python3 measure_startup.py --runs 5
+#
+# --server-script times another copy of server.py, e.g. an older checkout for
+# a before/after comparison; it is run from its own folder.
+import argparse
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_SCRIPT = os.path.join(SCRIPT_DIR, "server.py")
+
+
+def time_to_first_200(port, extra_args, timeout=60.0, server_script=SERVER_SCRIPT):
+    """Start the server once and return seconds until GET / returns 200"""
+    url = f"http://127.0.0.1:{port}/"
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, server_script, "--port", str(port)] + extra_args,
+        cwd=os.path.dirname(os.path.abspath(server_script)),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        # Own process group, so the reloader's child is stopped along with it
+        start_new_session=True,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"server exited with code {process.returncode}")
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError, OSError):
+                pass
+            time.sleep(0.01)
+        raise RuntimeError(f"no HTTP 200 within {timeout} seconds")
+    finally:
+        os.killpg(process.pid, signal.SIGTERM)
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure server.py startup time")
+    parser.add_argument("--runs", type=int, default=5, help="Number of launches")
+    parser.add_argument("--port", type=int, default=5050, help="Port to launch on")
+    parser.add_argument("--dev", action="store_true",
+                        help="Measure the debug/reloader mode instead of --production")
+    parser.add_argument("--server-script", default=SERVER_SCRIPT,
+                        help="server.py to launch (default: the one in this folder)")
+    args = parser.parse_args()
+
+    extra_args = [] if args.dev else ["--production"]
+    mode = "dev (debug + reloader)" if args.dev else "production"
+    times = []
+    for run in range(args.runs):
+        elapsed = time_to_first_200(args.port, extra_args, server_script=args.server_script)
+        times.append(elapsed)
+        print(f"run {run + 1}: {elapsed * 1000:.0f} ms")
+
+    print(f"Startup to first HTTP 200 ({mode}, {args.runs} runs): "
+          f"min {min(times) * 1000:.0f} ms, median {statistics.median(times) * 1000:.0f} ms, "
+          f"max {max(times) * 1000:.0f} ms")
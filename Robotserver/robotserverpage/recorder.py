@@ -0,0 +1,250 @@
+import mmap
+import os
+import queue
+import re
+import struct
+import threading
+import time
+
+# Recording setup
+# Frames are appended to rotating segment files (segment_<start_ms>.mjpg), which
+# are plain concatenated JPEGs. Every segment has a companion .idx file that maps
+# timestamps to byte offsets so playback can seek without scanning the segment.
+RECORDING_DIR = 'recordings'
+SEGMENT_SECONDS = 60                       # Start a new segment every minute
+RETENTION_BYTES = 2 * 1024 * 1024 * 1024   # Keep at most 2 GB of footage
+QUEUE_SIZE = 120                           # ~4 seconds of frames at 30 fps
+JPEG_QUALITY = 80                          # Only used when raw frames are submitted
+
+# Index file layout: an 8 byte record count followed by fixed size records of
+# (timestamp, offset, length). The count is written last so a reader never sees
+# a record that is not complete.
+INDEX_HEADER = struct.Struct('<Q')
+INDEX_RECORD = struct.Struct('<dQI')
+INDEX_GROW_RECORDS = 4096
+
+
+class SegmentIndex:
+    """Append-only, memory-mapped timestamp -> offset index for one segment"""
+
+    def __init__(self, path, writable=False):
+        self.path = path
+        self.writable = writable
+        if writable:
+            self.file = open(path, 'w+b')
+            self.file.truncate(INDEX_HEADER.size + INDEX_GROW_RECORDS * INDEX_RECORD.size)
+            self.map = mmap.mmap(self.file.fileno(), 0)
+            INDEX_HEADER.pack_into(self.map, 0, 0)
+        else:
+            self.file = open(path, 'rb')
+            # The writer creates the file empty and then sizes it; until then
+            # there is nothing to map and the index reads as empty
+            if os.fstat(self.file.fileno()).st_size < INDEX_HEADER.size:
+                self.map = None
+            else:
+                self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        if self.map is None:
+            return 0
+        count = INDEX_HEADER.unpack_from(self.map, 0)[0]
+        # A reader may have mapped the file before the writer grew it
+        capacity = (len(self.map) - INDEX_HEADER.size) // INDEX_RECORD.size
+        return min(count, capacity)
+
+    def append(self, timestamp, offset, length):
+        """Append one record, growing the file if it is full"""
+        count = len(self)
+        position = INDEX_HEADER.size + count * INDEX_RECORD.size
+        if position + INDEX_RECORD.size > len(self.map):
+            self.map.close()
+            self.file.truncate(position + INDEX_GROW_RECORDS * INDEX_RECORD.size)
+            self.map = mmap.mmap(self.file.fileno(), 0)
+        INDEX_RECORD.pack_into(self.map, position, timestamp, offset, length)
+        INDEX_HEADER.pack_into(self.map, 0, count + 1)
+
+    def record(self, i):
+        """Return (timestamp, offset, length) of record i"""
+        return INDEX_RECORD.unpack_from(self.map, INDEX_HEADER.size + i * INDEX_RECORD.size)
+
+    def find(self, timestamp):
+        """Return the index of the first record at or after timestamp"""
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self.record(middle)[0] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def close(self):
+        """Close the index, trimming unused space when it was being written"""
+        count = len(self)
+        if self.map is not None:
+            self.map.close()
+        if self.writable:
+            self.file.truncate(INDEX_HEADER.size + count * INDEX_RECORD.size)
+        self.file.close()
+
+
+class FrameRecorder:
+    """Write frames to rotating segment files on a background thread
+
+    submit() never blocks: when the queue is full the frame is dropped so that
+    recording can never stall the live stream.
+    """
+
+    def __init__(self, directory=RECORDING_DIR, segment_seconds=SEGMENT_SECONDS,
+                 retention_bytes=RETENTION_BYTES, queue_size=QUEUE_SIZE):
+        self.directory = directory
+        self.segment_seconds = segment_seconds
+        self.retention_bytes = retention_bytes
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.segment = None
+        self.index = None
+        self.segment_name = None
+        self.segment_start = 0
+        self.thread = None
+        self.running = False
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='FrameRecorder', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.frames.put(None)
+            self.thread.join()
+            self.thread = None
+        self._close_segment()
+
+    def submit(self, frame, timestamp=None):
+        """Queue a JPEG (bytes) or raw BGR frame (ndarray) for recording"""
+        if not self.running:
+            return
+        try:
+            self.frames.put_nowait((timestamp or time.time(), frame))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            item = self.frames.get()
+            if item is None:
+                break
+            timestamp, frame = item
+            if not isinstance(frame, (bytes, bytearray, memoryview)):
+                import cv2
+                ret, buffer = cv2.imencode('.jpg', frame,
+                                           [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+                if not ret:
+                    continue
+                frame = buffer
+            try:
+                self._write(timestamp, frame)
+            except OSError as e:
+                print(f"Error writing recording: {e}")
+
+    def _write(self, timestamp, jpeg):
+        if self.segment is None or timestamp - self.segment_start >= self.segment_seconds:
+            self._open_segment(timestamp)
+
+        offset = self.segment.tell()
+        self.segment.write(jpeg)
+        # Flush before indexing so readers never seek past the end of the data
+        self.segment.flush()
+        self.index.append(timestamp, offset, self.segment.tell() - offset)
+
+    def _open_segment(self, timestamp):
+        self._close_segment()
+        self.segment_name = f"segment_{int(timestamp * 1000)}"
+        self.segment_start = timestamp
+        base = os.path.join(self.directory, self.segment_name)
+        self.segment = open(base + '.mjpg', 'wb')
+        self.index = SegmentIndex(base + '.idx', writable=True)
+        self._apply_retention()
+
+    def _close_segment(self):
+        if self.segment:
+            self.segment.close()
+            self.index.close()
+            self.segment = None
+            self.index = None
+
+    def _apply_retention(self):
+        """Delete the oldest segments until the total size fits the budget"""
+        segments = list_segments(self.directory)
+        total = sum(s['bytes'] for s in segments)
+        for s in segments:
+            if total <= self.retention_bytes or s['name'] == self.segment_name:
+                break
+            base = os.path.join(self.directory, s['name'])
+            for path in (base + '.mjpg', base + '.idx'):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= s['bytes']
+
+
+def list_segments(directory=RECORDING_DIR):
+    """Return the recorded segments, oldest first"""
+    segments = []
+    for filename in os.listdir(directory):
+        # Only our own segment_<start_ms>.mjpg files, like the playback route
+        match = re.fullmatch(r'(segment_\d+)\.mjpg', filename)
+        if not match:
+            continue
+        name = match.group(1)
+        base = os.path.join(directory, name)
+        try:
+            index_size = os.path.getsize(base + '.idx')
+            size = os.path.getsize(base + '.mjpg') + index_size
+        except OSError:
+            continue
+        # Skip a segment whose index the writer has not sized yet
+        if index_size < INDEX_HEADER.size:
+            continue
+        segments.append({"name": name, "bytes": size})
+    segments.sort(key=lambda s: int(s['name'].split('_')[-1]))
+    return segments
+
+
+def describe_segment(directory, name):
+    """Return start/end time and frame count for a segment"""
+    index = SegmentIndex(os.path.join(directory, name + '.idx'))
+    try:
+        count = len(index)
+        if count == 0:
+            return {"name": name, "frames": 0, "start": None, "end": None}
+        return {
+            "name": name,
+            "frames": count,
+            "start": index.record(0)[0],
+            "end": index.record(count - 1)[0],
+        }
+    finally:
+        index.close()
+
+
+def read_frames(directory, name, start=None):
+    """Yield (timestamp, jpeg_bytes) from a segment, starting at a timestamp"""
+    base = os.path.join(directory, name)
+    index = SegmentIndex(base + '.idx')
+    try:
+        with open(base + '.mjpg', 'rb') as segment:
+            i = index.find(start) if start else 0
+            while i < len(index):
+                timestamp, offset, length = index.record(i)
+                segment.seek(offset)
+                yield timestamp, segment.read(length)
+                i += 1
+    finally:
+        index.close()
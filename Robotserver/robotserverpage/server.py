@@ -1,9 +1,21 @@
+import argparse
 import os
-import cv2
+import re
+import signal
+import sys
 import threading
 import time
-from flask import Flask, render_template, Response, jsonify, request
+from flask import Flask, render_template, Response, jsonify, request, abort
+from jinja2 import DictLoader
 import RPi.GPIO as GPIO  # For controlling GPIO pins on Jetson/RPi
+# pwm_backend.py is shared with claude_websocket in the folder above
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pwm_backend
+import camera
+import h264_stream
+import recorder
+import serving
+import vision
 
 # GPIO pin setup for motors
 # Using standard GPIO pin numbering
@@ -11,56 +23,123 @@ LEFT_MOTOR_PIN1 = 21
 LEFT_MOTOR_PIN2 = 23
 RIGHT_MOTOR_PIN1 = 22
 RIGHT_MOTOR_PIN2 = 24
-# MOTOR_ENABLE_PIN = 27  # PWM pin for speed control
+MOTOR_ENABLE_PIN = 27  # PWM pin for speed control (see pwm_backend for hardware PWM)
+PWM_FREQUENCY = 100   # Hz
+SPEED_DEFAULT = 50    # Duty cycle (0-100)
 
-# Initialize GPIO
-GPIO.setmode(GPIO.BCM)
-GPIO.setup(LEFT_MOTOR_PIN1, GPIO.OUT)
-GPIO.setup(LEFT_MOTOR_PIN2, GPIO.OUT)
-GPIO.setup(RIGHT_MOTOR_PIN1, GPIO.OUT)
-GPIO.setup(RIGHT_MOTOR_PIN2, GPIO.OUT)
-# GPIO.setup(MOTOR_ENABLE_PIN, GPIO.OUT)
+# GPIO is configured on the first motor command, not at import, so the
+# server can bind its port before touching any hardware
+gpio_ready = False
+gpio_lock = threading.Lock()
+pwm = None
+current_speed = SPEED_DEFAULT
 
-# Setup PWM for speed control
-# pwm = GPIO.PWM(MOTOR_ENABLE_PIN, 100)  # 100 Hz frequency
-# pwm.start(50)  # Start with 50% duty cycle
+def setup_gpio():
+    """Initialize GPIO once"""
+    global gpio_ready, pwm
+    with gpio_lock:
+        if gpio_ready:
+            return
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setup(LEFT_MOTOR_PIN1, GPIO.OUT)
+        GPIO.setup(LEFT_MOTOR_PIN2, GPIO.OUT)
+        GPIO.setup(RIGHT_MOTOR_PIN1, GPIO.OUT)
+        GPIO.setup(RIGHT_MOTOR_PIN2, GPIO.OUT)
+
+        # Setup PWM for speed control
+        pwm = pwm_backend.create_pwm(MOTOR_ENABLE_PIN, PWM_FREQUENCY, gpio=GPIO)
+        pwm.start(current_speed)
+        gpio_ready = True
 
 # Camera setup
-camera = cv2.VideoCapture(0)  # Use default camera (may need to change index)
-if not camera.isOpened():
-    print("Error: Could not open camera")
-    exit()
+# Each camera named in camera.CAMERAS (or ROBOT_CAMERAS) gets its own capture
+# thread at 640x480; JPEG encoding is shared across cores by camera.encode_pool.
+# Each size in camera.TIERS (or ROBOT_TIERS) is encoded while it has viewers.
+# Cameras are opened by warm_up() in the background or by the first viewer.
+cameras = camera.CameraRegistry(camera.cameras_from_env(), camera.tiers_from_env())
 
-# Set resolution to 640x480 for better performance
-camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+def warm_up():
+    """Open the cameras in the background so the first viewer doesn't wait"""
+    if not cameras.start():
+        print("Error: Could not open any camera")
 
 # Initialize Flask app
 app = Flask(__name__)
 
+# Record everything each camera captures; the recorders write on their own threads
+recorders = {name: recorder.FrameRecorder(os.path.join(recorder.RECORDING_DIR, name))
+             for name in cameras.names()}
+
+def start_recorders():
+    """Start the recorder threads; call after start_vision(), which forks"""
+    for name, frame_recorder in recorders.items():
+        frame_recorder.start()
+        cameras.get(name).add_listener(frame_recorder.submit)
+
+# Vision setup
+# ROBOT_VISION="motion,brightness" runs those stages on the default camera in
+# worker processes (see vision.py); the latest results are served at /vision
+vision_pipeline = None
+
+def start_vision():
+    """Fork the vision workers; call before the cameras open"""
+    global vision_pipeline
+    stages = vision.stages_from_env()
+    if not stages:
+        return
+    try:
+        vision_pipeline = vision.VisionPipeline(cameras.get(cameras.default), stages).start()
+    except (ImportError, ValueError) as e:
+        # multiprocessing.shared_memory needs Python 3.8+
+        print(f"Error: Could not start vision pipeline: {e}")
+
+# Production serving
+# Under gevent (see serving.py) stream viewers are greenlets, so they wait on a
+# FrameSignal per stream instead of blocking on the stream's thread condition
+cooperative = False
+frame_signals = {}
+
+def stream_wait(key, add_listener):
+    """The wait function for a stream's viewers, or None under a threaded server"""
+    if not cooperative:
+        return None
+    if key not in frame_signals:
+        frame_signals[key] = serving.FrameSignal()
+        add_listener(frame_signals[key].notify)
+    return frame_signals[key].wait
+
+def ensure_started(camera_stream):
+    """Open a camera if it isn't yet, without holding up other requests"""
+    if cooperative:
+        return serving.run_blocking(camera_stream.start)
+    return camera_stream.start()
+
 # Variables to control motors
 is_moving = False
 current_direction = "stop"
 
-def generate_frames():
-    """Generate camera frames with OpenCV"""
-    while True:
-        success, frame = camera.read()
-        if not success:
-            break
-        else:
-            # Encode frame as JPEG
-            ret, buffer = cv2.imencode('.jpg', frame)
-            frame_bytes = buffer.tobytes()
-            
-            # Yield the frame in the MJPEG format
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+# MJPEG part framing, written around each frame rather than joined to it
+MJPEG_PART_HEADER = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+MJPEG_PART_END = b'\r\n'
+
+def generate_frames(camera_stream, copy_frames=False, wait=None, tier=camera.DEFAULT_TIER):
+    """Generate camera frames encoded by the camera's capture thread"""
+    for jpeg in camera_stream.frames(wait=wait, tier=tier):
+        # Yield the frame in the MJPEG format. Every viewer gets the same
+        # encoder buffer; it is only copied for servers that require bytes.
+        yield MJPEG_PART_HEADER
+        yield bytes(jpeg) if copy_frames else jpeg
+        yield MJPEG_PART_END
+
+def server_requires_bytes():
+    """Werkzeug's dev server rejects anything but bytes from a response"""
+    return request.environ.get('SERVER_SOFTWARE', '').startswith('Werkzeug')
 
 def control_motors(direction):
     """Control the robot's motors based on direction"""
     global current_direction
     current_direction = direction
+    setup_gpio()
     
     if direction == "forward":
         GPIO.output(LEFT_MOTOR_PIN1, GPIO.HIGH)
@@ -91,14 +170,115 @@ def control_motors(direction):
 @app.route('/')
 def index():
     """Render the main page"""
+    # Served from INDEX_HTML through the in-memory loader below
     return render_template('index.html')
 
 @app.route('/video_feed')
-def video_feed():
-    """Stream the video feed from the camera"""
-    return Response(generate_frames(),
+@app.route('/video_feed/<camera_name>')
+def video_feed(camera_name=None):
+    """Stream the video feed from a camera (the first one by default)
+
+    ?tier=<name> picks a smaller size, e.g. thumb for an overview page
+    """
+    camera_stream = cameras.get(camera_name or cameras.default)
+    if camera_stream is None:
+        abort(404)
+    tier = request.args.get('tier', camera.DEFAULT_TIER)
+    if tier not in camera_stream.tiers:
+        abort(404)
+    if not ensure_started(camera_stream):
+        abort(503)
+    # The wake-up listener must not keep the tier encoding once its viewers leave
+    wait = stream_wait(('mjpeg', camera_stream.name, tier),
+                       lambda notify: camera_stream.add_listener(notify, tier, keep_encoding=False))
+    return Response(generate_frames(camera_stream, copy_frames=server_requires_bytes(),
+                                    wait=wait, tier=tier),
+                    mimetype='multipart/x-mixed-replace; boundary=frame')
+
+# One shared H.264 encoder per camera, created on first use
+h264_streams = {}
+h264_lock = threading.Lock()
+
+@app.route('/video_feed_h264')
+@app.route('/video_feed_h264/<camera_name>')
+def video_feed_h264(camera_name=None):
+    """Stream a camera as H.264 in fragmented MP4 (much less bandwidth than MJPEG)"""
+    camera_name = camera_name or cameras.default
+    camera_stream = cameras.get(camera_name)
+    if camera_stream is None:
+        abort(404)
+    if not h264_stream.available() or not ensure_started(camera_stream):
+        abort(503)
+    with h264_lock:
+        if camera_name not in h264_streams:
+            h264_streams[camera_name] = h264_stream.H264Stream(camera_stream)
+    stream = h264_streams[camera_name]
+    wait = stream_wait(('h264', camera_name), stream.add_listener)
+    return Response(stream.subscribe(wait=wait), mimetype='video/mp4')
+
+@app.route('/cameras')
+def camera_list():
+    """List the configured cameras and their stream tiers"""
+    return jsonify({
+        "cameras": cameras.names(),
+        "default": cameras.default,
+        "tiers": {name: cameras.get(name).tier_stats() for name in cameras.names()},
+    })
+
+def get_recorder():
+    """Return the recorder for ?camera=<name> (the first camera by default)"""
+    frame_recorder = recorders.get(request.args.get('camera', cameras.default))
+    if frame_recorder is None:
+        abort(404)
+    return frame_recorder
+
+@app.route('/recording')
+def recording():
+    """List the recorded segments"""
+    frame_recorder = get_recorder()
+    segments = []
+    for segment in recorder.list_segments(frame_recorder.directory):
+        info = recorder.describe_segment(frame_recorder.directory, segment['name'])
+        info['bytes'] = segment['bytes']
+        segments.append(info)
+    return jsonify({"segments": segments, "dropped_frames": frame_recorder.dropped})
+
+@app.route('/recording/<name>')
+def recording_playback(name):
+    """Play back a recorded segment, optionally seeking with ?t=<unix time>"""
+    frame_recorder = get_recorder()
+    if not re.fullmatch(r'segment_\d+', name):
+        abort(404)
+    if not os.path.exists(os.path.join(frame_recorder.directory, name + '.idx')):
+        abort(404)
+    start = request.args.get('t', type=float)
+
+    def generate():
+        previous = None
+        for timestamp, jpeg in recorder.read_frames(frame_recorder.directory, name, start):
+            # Pace playback at the recorded rate
+            if previous is not None:
+                time.sleep(min(max(timestamp - previous, 0), 1.0))
+            previous = timestamp
+            yield MJPEG_PART_HEADER
+            yield jpeg
+            yield MJPEG_PART_END
+
+    return Response(generate(),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
+@app.route('/vision')
+def vision_results():
+    """Latest result of each vision stage, with per-stage latency and drops"""
+    if vision_pipeline is None:
+        return jsonify({"enabled": False})
+    return jsonify({
+        "enabled": True,
+        "camera": vision_pipeline.camera_stream.name,
+        "results": dict(vision_pipeline.results),
+        "stats": vision_pipeline.stats(),
+    })
+
 @app.route('/control', methods=['POST'])
 def control():
     """Endpoint to control the robot's movement"""
@@ -113,26 +293,25 @@ def status():
     """Return the current status of the robot"""
     return jsonify({
         "direction": current_direction,
-        "speed": pwm.ChangeDutyCycle,
+        "speed": current_speed,
+        "pwm_backend": pwm.backend if pwm else None,
         "is_moving": is_moving
     })
 
 @app.route('/speed', methods=['POST'])
 def set_speed():
     """Set the motor speed (PWM duty cycle)"""
+    global current_speed
     speed = request.json.get('speed')
-    if 0 <= speed <= 100:
+    if isinstance(speed, (int, float)) and 0 <= speed <= 100:
+        setup_gpio()
         pwm.ChangeDutyCycle(speed)
+        current_speed = speed
         return jsonify({"status": "success", "speed": speed})
     return jsonify({"status": "error", "message": "Invalid speed"})
 
-# Create templates directory if it doesn't exist
-if not os.path.exists('templates'):
-    os.makedirs('templates')
-
-# Create the HTML template
-with open('templates/index.html', 'w') as f:
-    f.write("""
+# The HTML template, kept in memory instead of being written to templates/
+INDEX_HTML = """
 <!DOCTYPE html>
 <html>
 <head>
@@ -155,6 +334,7 @@ with open('templates/index.html', 'w') as f:
             box-shadow: 0 0 10px rgba(0,0,0,0.1);
         }
         .video-container {
+            position: relative;
             margin: 20px 0;
             border: 1px solid #ccc;
             border-radius: 5px;
@@ -165,6 +345,10 @@ with open('templates/index.html', 'w') as f:
             max-width: 640px;
             height: auto;
         }
+        #vision-overlay {
+            position: absolute;
+            pointer-events: none;
+        }
         .controls {
             display: flex;
             flex-direction: column;
@@ -217,7 +401,8 @@ with open('templates/index.html', 'w') as f:
         <h1>Robot Control Panel</h1>
         
         <div class="video-container">
-            <img src="{{ url_for('video_feed') }}" alt="Robot Camera Feed">
+            <img id="feed" src="{{ url_for('video_feed') }}" alt="Robot Camera Feed">
+            <canvas id="vision-overlay"></canvas>
         </div>
         
         <div class="controls">
@@ -320,6 +505,44 @@ with open('templates/index.html', 'w') as f:
                 });
             });
             
+            // Draw vision boxes over the feed while the pipeline is enabled
+            const feed = document.getElementById('feed');
+            const overlay = document.getElementById('vision-overlay');
+            let visionEnabled = true;
+            function drawVision() {
+                fetch('/vision')
+                .then(response => response.json())
+                .then(data => {
+                    if (!data.enabled) {
+                        visionEnabled = false;
+                        return;
+                    }
+                    overlay.style.left = feed.offsetLeft + 'px';
+                    overlay.style.top = feed.offsetTop + 'px';
+                    overlay.style.width = feed.clientWidth + 'px';
+                    overlay.style.height = feed.clientHeight + 'px';
+                    overlay.width = feed.naturalWidth;
+                    overlay.height = feed.naturalHeight;
+                    const context = overlay.getContext('2d');
+                    context.strokeStyle = '#00ff00';
+                    context.lineWidth = 2;
+                    for (const latest of Object.values(data.results)) {
+                        for (const [x, y, w, h] of latest.result.boxes || []) {
+                            context.strokeRect(x, y, w, h);
+                        }
+                    }
+                })
+                .catch(error => console.error('Error:', error))
+                .finally(() => {
+                    // Keep polling after a failed fetch too; only stop when
+                    // the server says vision is off
+                    if (visionEnabled) {
+                        setTimeout(drawVision, 200);
+                    }
+                });
+            }
+            drawVision();
+            
             // Add keyboard controls
             document.addEventListener('keydown', function(event) {
                 switch(event.key) {
@@ -344,23 +567,66 @@ with open('templates/index.html', 'w') as f:
     </script>
 </body>
 </html>
-    """)
+    """
+app.jinja_loader = DictLoader({'index.html': INDEX_HTML})
+
+cleaned_up = False
 
 def cleanup():
-    """Clean up resources on shutdown"""
+    """Clean up resources on shutdown (once, however the server stops)"""
+    global cleaned_up
+    if cleaned_up:
+        return
+    cleaned_up = True
     print("Cleaning up resources...")
-    GPIO.cleanup()
-    camera.release()
+    if gpio_ready:
+        pwm.stop()
+        GPIO.cleanup()
+    cameras.close()
+    for frame_recorder in recorders.values():
+        frame_recorder.stop()
+    if vision_pipeline is not None:
+        vision_pipeline.stop()
 
 # Run the Flask app when this script is executed
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Robot Control Web Server')
+    parser.add_argument('--production', action='store_true',
+                        help='Disable debug mode and the reloader (opens the camera once)')
+    parser.add_argument('--port', type=int, default=5000, help='Port to listen on')
+    parser.add_argument('--server', choices=['gevent', 'werkzeug'],
+                        help='HTTP server (default: gevent in production if installed, '
+                             'otherwise the Werkzeug dev server)')
+    args = parser.parse_args()
+    server = args.server or ('gevent' if args.production and serving.available() else 'werkzeug')
+
     try:
         print("Starting Robot Control Web Server...")
-        print("Access the control panel at http://[YOUR_IP_ADDRESS]:5000")
+        print(f"Access the control panel at http://[YOUR_IP_ADDRESS]:{args.port}")
+        if server == 'gevent':
+            serving.patch()
+            cooperative = True
+        else:
+            # Exit through atexit on SIGTERM too, so GPIO is always cleaned up
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
         # Add this to ensure cleanup happens on exit
         import atexit
         atexit.register(cleanup)
+        # With the debug reloader the parent process only watches files, so
+        # only warm up in the process that actually serves requests
+        if args.production or server == 'gevent' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            start_vision()
+            start_recorders()
+            threading.Thread(target=warm_up, name='WarmUp', daemon=True).start()
         # Run on all network interfaces (0.0.0.0) so you can access it from other devices
-        app.run(host='0.0.0.0', port=5000, debug=True, threaded=True)
+        if server == 'gevent':
+            print(f"Serving with gevent on port {args.port}")
+            serving.serve(app, '0.0.0.0', args.port)
+        else:
+            app.run(host='0.0.0.0', port=args.port, debug=not args.production,
+                    use_reloader=not args.production, threaded=True)
     except KeyboardInterrupt:
-        cleanup()
\ No newline at end of file
+        pass
+    finally:
+        # Before interpreter shutdown stops the encode pool under the cameras
+        cleanup()
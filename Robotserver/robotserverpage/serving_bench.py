@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# serving_bench.py
+# Compare the Werkzeug dev server with the gevent production server under many
+# MJPEG viewers. server.py is started on the built-in test pattern camera;
+# the viewers connect together and read their streams while control
+# requests are timed. Reports per-viewer frame rate, control latency, and the
+# server's threads and RSS. Run from this folder:
+#
+#   python3 serving_bench.py --viewers 10,100,300 --seconds 10
+import argparse
+import asyncio
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_SCRIPT = os.path.join(SCRIPT_DIR, "server.py")
+BOUNDARY = b"--frame\r\n"
+
+
+def start_server(server, port):
+    env = dict(os.environ, ROBOT_CAMERAS="front=test")
+    process = subprocess.Popen(
+        [sys.executable, SERVER_SCRIPT, "--production", "--server", server, "--port", str(port)],
+        cwd=SCRIPT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        start_new_session=True)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{server} server exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/cameras", timeout=1):
+                return process
+        except (urllib.error.URLError, ConnectionError, OSError):
+            time.sleep(0.05)
+    raise RuntimeError(f"{server} server did not start")
+
+
+def stop_server(process):
+    """SIGTERM and time the shutdown, as systemd would"""
+    start = time.monotonic()
+    os.killpg(process.pid, signal.SIGTERM)
+    try:
+        process.wait(timeout=10)
+        return time.monotonic() - start
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        return None
+
+
+def process_usage(pid):
+    threads = rss = 0
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("Threads:"):
+                threads = int(line.split()[1])
+            elif line.startswith("VmRSS:"):
+                rss = int(line.split()[1]) / 1024
+    return threads, rss
+
+
+async def viewer(port, stop_at, counts, index):
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    except OSError:
+        return
+    writer.write(b"GET /video_feed HTTP/1.1\r\nHost: bench\r\n\r\n")
+    tail = b""
+    try:
+        while time.monotonic() < stop_at:
+            data = await asyncio.wait_for(reader.read(65536), timeout=max(stop_at - time.monotonic(), 0.01))
+            if not data:
+                break
+            chunk = tail + data
+            counts[index] += chunk.count(BOUNDARY)
+            tail = chunk[-len(BOUNDARY) + 1:]
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def control_requests(port, stop_at, latencies, failures):
+    request = (b"GET /cameras HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n")
+    while time.monotonic() < stop_at:
+        start = time.monotonic()
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection("127.0.0.1", port), timeout=5)
+            writer.write(request)
+            await asyncio.wait_for(reader.read(), timeout=5)
+            writer.close()
+            latencies.append(time.monotonic() - start)
+        except (asyncio.TimeoutError, OSError):
+            failures.append(1)
+        await asyncio.sleep(0.1)
+
+
+async def load(port, viewers, seconds, pid):
+    counts = [0] * viewers
+    latencies = []
+    failures = []
+    # Let every viewer connect before measuring
+    warm_up = 2.0
+    stop_at = time.monotonic() + warm_up + seconds
+    tasks = [asyncio.ensure_future(viewer(port, stop_at, counts, i)) for i in range(viewers)]
+    await asyncio.sleep(warm_up)
+    baseline = list(counts)
+    usage = []
+    control = asyncio.ensure_future(control_requests(port, stop_at, latencies, failures))
+    while time.monotonic() < stop_at - 0.5:
+        await asyncio.sleep(1.0)
+        usage.append(process_usage(pid))
+    await asyncio.gather(control, *tasks)
+    rates = [(c - b) / seconds for c, b in zip(counts, baseline)]
+    return rates, latencies, len(failures), usage
+
+
+def run(server, port, viewers, seconds):
+    process = start_server(server, port)
+    try:
+        rates, latencies, failures, usage = asyncio.run(load(port, viewers, seconds, process.pid))
+    finally:
+        shutdown = stop_server(process)
+    served = sum(1 for rate in rates if rate > 1)
+    latencies_ms = sorted(latency * 1000 for latency in latencies) or [float("nan")]
+    p99 = latencies_ms[min(len(latencies_ms) - 1, int(len(latencies_ms) * 0.99))]
+    threads = max(u[0] for u in usage) if usage else 0
+    rss = max(u[1] for u in usage) if usage else 0
+    print("%-9s %8d %10s %10.1f %12.1f %10.1f %8d %8d %8.0f %10s" % (
+        server, viewers, f"{served}/{viewers}", statistics.median(rates),
+        statistics.median(latencies_ms), p99, failures, threads, rss,
+        f"{shutdown:.2f}" if shutdown is not None else "killed"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dev server vs gevent under MJPEG load")
+    parser.add_argument("--viewers", default="10,100,300", help="Comma separated viewer counts")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--servers", default="werkzeug,gevent")
+    args = parser.parse_args()
+
+    print("%-9s %8s %10s %10s %12s %10s %8s %8s %8s %10s" % (
+        "server", "viewers", "streaming", "fps/view", "ctl p50 ms", "ctl p99 ms",
+        "ctl fail", "threads", "RSS MB", "SIGTERM s"))
+    for count in (int(v) for v in args.viewers.split(",")):
+        for server in args.servers.split(","):
+            run(server, args.port, count, args.seconds)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# tier_bench.py
+# What each simulcast tier (camera.TIERS) costs. First, per capture size: the
+# CPU time to scale and encode one frame for each tier and the JPEG size, next
+# to the full tier. Then a live CameraStream on the test pattern with viewers
+# on some tiers only: how many frames each tier encoded (tiers without viewers
+# should stay at 0) and the process CPU it took.
+#
+#   python3 tier_bench.py --frames 200 --seconds 5 --viewers thumb=8
+import argparse
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import camera
+
+SIZES = [(640, 480), (1280, 720)]
+
+
+def synthetic_frames(width, height, count):
+    """Blurred noise with a moving box, roughly as hard to compress as a room"""
+    rng = np.random.default_rng(0)
+    background = cv2.GaussianBlur(
+        rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (0, 0), 3)
+    frames = []
+    for i in range(count):
+        frame = background.copy()
+        cx = int(width / 2 + width / 3 * np.sin(i / 10))
+        cv2.rectangle(frame, (cx - width // 16, height // 2 - height // 12),
+                      (cx + width // 16, height // 2 + height // 12), (40, 80, 220), -1)
+        frames.append(frame)
+    return frames
+
+
+def encode_costs(tiers, frames):
+    """CPU seconds and bytes per frame for each tier, encoding like CameraStream._encode"""
+    costs = {}
+    cv2.imencode('.jpg', frames[0])  # Load the encoder before timing
+    for name, (width, quality) in tiers.items():
+        tier = camera.StreamTier(name, width, quality)
+        sizes = []
+        start = time.process_time()
+        for frame in frames:
+            scaled = frame
+            steps = tier.scaled_buffers(frame)
+            for step in steps:
+                cv2.resize(scaled, (step.shape[1], step.shape[0]), dst=step,
+                           interpolation=cv2.INTER_AREA)
+                scaled = step
+            ret, jpeg = cv2.imencode('.jpg', scaled, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            sizes.append(len(jpeg))
+            for step in steps:
+                tier.pool.release(step)
+        costs[name] = ((time.process_time() - start) / len(frames), np.mean(sizes),
+                       tier.shape or frame.shape)
+    return costs
+
+
+def run_costs(tiers, count):
+    print("%-10s %-8s %10s %12s %10s %10s" % (
+        "capture", "tier", "size", "CPU ms/frm", "KB/frame", "vs full"))
+    for width, height in SIZES:
+        costs = encode_costs(tiers, synthetic_frames(width, height, count))
+        full_cpu, full_bytes, _ = costs[camera.DEFAULT_TIER]
+        for name, (cpu, size, shape) in costs.items():
+            print("%-10s %-8s %10s %12.2f %10.1f %10s" % (
+                f"{width}x{height}", name, f"{shape[1]}x{shape[0]}", cpu * 1000, size / 1024,
+                f"{cpu / full_cpu:.0%}/{size / full_bytes:.0%}"))
+
+
+def run_live(tiers, viewers, seconds):
+    stream = camera.CameraStream('bench', 'test', tiers=tiers)
+    stream.start()
+    time.sleep(0.5)
+    stop = threading.Event()
+
+    def viewer(tier):
+        for jpeg in stream.frames(timeout=0.5, tier=tier):
+            if stop.is_set():
+                break
+
+    threads = [threading.Thread(target=viewer, args=(name,), daemon=True)
+               for name, count in viewers.items() for _ in range(count)]
+    before = stream.tier_stats()
+    start_cpu = time.process_time()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    cpu = time.process_time() - start_cpu
+    stop.set()
+    for thread in threads:
+        thread.join()
+    after = stream.tier_stats()
+    stream.stop()
+
+    print(f"test pattern {stream.width}x{stream.height}, viewers: "
+          + ", ".join(f"{count} on {name}" for name, count in viewers.items()))
+    print("%-8s %8s %10s %10s" % ("tier", "viewers", "encoded", "fps"))
+    for name in tiers:
+        encoded = after[name]["encoded"] - before[name]["encoded"]
+        print("%-8s %8d %10d %10.1f" % (name, viewers.get(name, 0), encoded, encoded / seconds))
+    print(f"process CPU: {100 * cpu / seconds:.0f}% of one core")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Cost of each simulcast tier')
+    parser.add_argument('--frames', type=int, default=200, help='Frames to encode per tier and size')
+    parser.add_argument('--seconds', type=float, default=5, help='Length of the live run')
+    parser.add_argument('--viewers', default='thumb=8', help='Live viewers per tier, e.g. full=1,thumb=8')
+    args = parser.parse_args()
+
+    tiers = camera.tiers_from_env()
+    viewers = {}
+    for entry in args.viewers.split(','):
+        name, _, count = entry.partition('=')
+        viewers[name.strip()] = int(count or 1)
+    run_costs(tiers, args.frames)
+    print()
+    run_live(tiers, viewers, args.seconds)
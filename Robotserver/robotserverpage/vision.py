@@ -0,0 +1,297 @@
+import collections
+import importlib
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+# Vision pipeline setup
+# Analysis stages run in worker processes, one per stage, so they never hold
+# the GIL the capture and streaming threads need. Captured frames are copied
+# once into a ring of shared memory slots; each job sent to a worker is only
+# (slot, seq, capture time). A stage that is still busy misses the frame, and
+# when every slot is in use the frame is skipped: the camera never waits.
+#
+# Enable with ROBOT_VISION="motion,brightness". A stage is a function
+# stage(frame, state) -> dict, either one of the built-ins below or any
+# importable "module:function". frame is read-only and only valid during the
+# call; state is a dict the stage can keep between frames.
+SLOT_COUNT = 4         # Frames that can be under analysis at once
+STAGE_QUEUE_SIZE = 1   # Frames waiting per stage; more are dropped
+STATS_WINDOW = 100     # Recent frames that latency figures are taken over
+ANALYSIS_WIDTH = 160   # Built-in stages work on a frame scaled to this width
+
+
+def stages_from_env(default=""):
+    """Parse ROBOT_VISION into a list of stage names"""
+    value = os.environ.get('ROBOT_VISION', default)
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def _small_gray(frame):
+    import cv2
+
+    scale = ANALYSIS_WIDTH / frame.shape[1]
+    small = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), scale
+
+
+def brightness(frame, state):
+    """Mean brightness and contrast, e.g. to warn that the camera is covered"""
+    gray, _ = _small_gray(frame)
+    return {"mean": round(float(gray.mean()), 1), "contrast": round(float(gray.std()), 1)}
+
+
+def motion(frame, state):
+    """Boxes around regions that changed since the previous frame"""
+    import cv2
+
+    gray, scale = _small_gray(frame)
+    gray = cv2.GaussianBlur(gray, (5, 5), 0)
+    previous = state.get("previous")
+    state["previous"] = gray
+    if previous is None or previous.shape != gray.shape:
+        return {"boxes": [], "changed": 0.0}
+
+    mask = cv2.threshold(cv2.absdiff(previous, gray), 25, 255, cv2.THRESH_BINARY)[1]
+    mask = cv2.dilate(mask, None, iterations=2)
+    contours = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2]
+    boxes = []
+    for contour in contours:
+        if cv2.contourArea(contour) < 20:
+            continue
+        x, y, w, h = cv2.boundingRect(contour)
+        boxes.append([int(x / scale), int(y / scale), int(w / scale), int(h / scale)])
+    return {"boxes": boxes, "changed": round(float((mask > 0).mean()), 4)}
+
+
+STAGES = {
+    "brightness": brightness,
+    "motion": motion,
+}
+
+
+def load_stage(name):
+    """Look up a built-in stage or import a "module:function" one"""
+    if name in STAGES:
+        return STAGES[name]
+    module, _, function = name.partition(':')
+    if not function:
+        raise ValueError(f"Unknown vision stage {name}")
+    return getattr(importlib.import_module(module), function)
+
+
+def _worker(name, jobs, results):
+    """Run one stage on frames from shared memory until told to stop"""
+    import numpy as np
+    from multiprocessing import shared_memory
+
+    function = load_stage(name)
+    state = {}
+    memory = None
+    layout = None
+    parent = os.getppid()
+    while True:
+        try:
+            job = jobs.get(timeout=1.0)
+        except queue.Empty:
+            # Exit with the server even if it was killed before stop()
+            if os.getppid() != parent:
+                break
+            continue
+        if job is None:
+            break
+        memory_name, shape, slot, seq, captured_at = job
+        if memory is None or memory.name != memory_name:
+            if memory is not None:
+                memory.close()
+                memory = None
+            try:
+                memory = shared_memory.SharedMemory(name=memory_name)
+            except FileNotFoundError:
+                # The frame size changed and the old slots are gone
+                results.put((name, memory_name, slot, seq, captured_at, time.monotonic(),
+                             time.monotonic(), {"error": "frame no longer available"}))
+                continue
+            layout = shape
+        slot_bytes = int(np.prod(layout))
+        frame = np.ndarray(layout, dtype=np.uint8, buffer=memory.buf,
+                           offset=slot * slot_bytes)
+        frame.flags.writeable = False
+
+        started = time.monotonic()
+        try:
+            result = function(frame, state)
+        except Exception as e:
+            result = {"error": str(e)}
+        del frame
+        results.put((name, memory_name, slot, seq, captured_at, started, time.monotonic(), result))
+    if memory is not None:
+        memory.close()
+
+
+class StageStats:
+    """Counters and recent timings for one stage"""
+
+    def __init__(self):
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.latency = collections.deque(maxlen=STATS_WINDOW)   # capture -> result
+        self.run_time = collections.deque(maxlen=STATS_WINDOW)  # time in the stage
+
+    def as_dict(self):
+        return {
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "latency_ms": _summary_ms(self.latency),
+            "run_ms": _summary_ms(self.run_time),
+        }
+
+
+def _summary_ms(values):
+    if not values:
+        return {"mean": None, "max": None}
+    return {"mean": round(sum(values) / len(values) * 1000, 1),
+            "max": round(max(values) * 1000, 1)}
+
+
+class VisionPipeline:
+    """Run analysis stages on a camera's frames in worker processes
+
+    Start it before the cameras open: workers are forked, and a process
+    forked before OpenCV and the capture threads start up is the safe kind.
+    """
+
+    def __init__(self, camera_stream, stages, slots=SLOT_COUNT):
+        self.camera_stream = camera_stream
+        self.stage_names = list(stages)
+        self.slot_count = slots
+        self.context = multiprocessing.get_context('fork')
+        self.lock = threading.Lock()
+        self.memory = None
+        self.frames = None       # One ndarray view per slot
+        self.slot_refs = [0] * slots  # Stages still reading each slot
+        self.jobs = {}
+        self.results_queue = None
+        self.workers = []
+        self.collector = None
+        self.seq = 0
+        self.published = 0
+        self.skipped = 0         # No free slot
+        self.stage_stats = {name: StageStats() for name in self.stage_names}
+        self.results = {}        # Latest result per stage
+
+    def start(self):
+        from multiprocessing import resource_tracker
+
+        # Share one tracker with the workers so a worker exiting never
+        # unlinks the shared memory under the others
+        resource_tracker.ensure_running()
+        for name in self.stage_names:
+            load_stage(name)  # Fail here, not in a worker, on a bad name
+        self.results_queue = self.context.Queue()
+        for name in self.stage_names:
+            self.jobs[name] = self.context.Queue(maxsize=STAGE_QUEUE_SIZE)
+            worker = self.context.Process(target=_worker, name=f"Vision-{name}",
+                                          args=(name, self.jobs[name], self.results_queue),
+                                          daemon=True)
+            worker.start()
+            self.workers.append(worker)
+        self.collector = threading.Thread(target=self._collect, name='VisionResults', daemon=True)
+        self.collector.start()
+        self.camera_stream.add_frame_listener(self._on_frame)
+        return self
+
+    def stop(self):
+        self.camera_stream.remove_frame_listener(self._on_frame)
+        for jobs in self.jobs.values():
+            try:
+                jobs.put(None, timeout=1.0)
+            except queue.Full:
+                pass
+        for worker in self.workers:
+            worker.join(timeout=2.0)
+            if worker.is_alive():
+                worker.terminate()
+        self.workers = []
+        if self.results_queue is not None:
+            self.results_queue.put(None)
+            self.collector.join()
+            self.results_queue = None
+        if self.memory is not None:
+            self.frames = None
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+
+    def _allocate(self, frame):
+        import numpy as np
+        from multiprocessing import shared_memory
+
+        old = self.memory
+        self.memory = shared_memory.SharedMemory(create=True, size=frame.nbytes * self.slot_count)
+        self.frames = [np.ndarray(frame.shape, dtype=np.uint8, buffer=self.memory.buf,
+                                  offset=slot * frame.nbytes)
+                       for slot in range(self.slot_count)]
+        self.slot_refs = [0] * self.slot_count
+        if old is not None:
+            # Workers still reading the old block keep their own mapping
+            old.close()
+            old.unlink()
+
+    def _on_frame(self, frame):
+        # Called from the capture thread; never blocks
+        captured_at = time.monotonic()
+        if self.frames is None or self.frames[0].shape != frame.shape:
+            with self.lock:
+                self._allocate(frame)
+        with self.lock:
+            free = [slot for slot, refs in enumerate(self.slot_refs) if refs == 0]
+            if not free:
+                self.skipped += 1
+                return
+            slot = free[0]
+            self.slot_refs[slot] = len(self.stage_names)  # Held while being filled
+        self.frames[slot][...] = frame
+        self.seq += 1
+        self.published += 1
+
+        job = (self.memory.name, frame.shape, slot, self.seq, captured_at)
+        accepted = 0
+        for name in self.stage_names:
+            try:
+                self.jobs[name].put_nowait(job)
+                accepted += 1
+            except queue.Full:
+                self.stage_stats[name].dropped += 1
+        with self.lock:
+            self.slot_refs[slot] -= len(self.stage_names) - accepted
+
+    def _collect(self):
+        while True:
+            item = self.results_queue.get()
+            if item is None:
+                break
+            name, memory_name, slot, seq, captured_at, started, finished, result = item
+            with self.lock:
+                # A result for a block replaced since (the frame size changed)
+                # says nothing about the slots of the current one
+                if self.memory is not None and memory_name == self.memory.name:
+                    self.slot_refs[slot] = max(self.slot_refs[slot] - 1, 0)
+            stats = self.stage_stats[name]
+            stats.processed += 1
+            if "error" in result:
+                stats.errors += 1
+            stats.latency.append(finished - captured_at)
+            stats.run_time.append(finished - started)
+            self.results[name] = {"seq": seq, "time": time.time(), "result": result}
+
+    def stats(self):
+        return {
+            "published": self.published,
+            "skipped_no_slot": self.skipped,
+            "stages": {name: stats.as_dict() for name, stats in self.stage_stats.items()},
+        }
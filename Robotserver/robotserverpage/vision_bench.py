@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# vision_bench.py
+# What vision analysis costs the capture thread. Synthetic 640x480 frames are
+# produced at a fixed rate, like CameraStream._capture, and handed to the
+# stages either inline (called from the capture loop) or through
+# VisionPipeline (shared memory slots and worker processes). The "slow" stage
+# stands in for a detector that can't keep up with the camera.
+#
+#   python3 vision_bench.py --seconds 5 --fps 30 --stages motion,brightness,vision_bench:slow
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+import vision
+
+WIDTH = 640
+HEIGHT = 480
+
+
+def slow(frame, state):
+    """A stage that takes 150 ms, far longer than a frame interval"""
+    time.sleep(0.15)
+    return {"mean": float(frame[::8, ::8].mean())}
+
+
+class FakeCamera:
+    """Just enough of CameraStream for VisionPipeline"""
+
+    def __init__(self):
+        self.frame_listeners = []
+
+    def add_frame_listener(self, callback):
+        self.frame_listeners = self.frame_listeners + [callback]
+
+    def remove_frame_listener(self, callback):
+        self.frame_listeners = [c for c in self.frame_listeners if c != callback]
+
+
+def synthetic_frames(width=WIDTH, height=HEIGHT):
+    rng = np.random.default_rng(0)
+    background = cv2.GaussianBlur(
+        rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (0, 0), 6)
+    i = 0
+    while True:
+        frame = background.copy()
+        cx = int(width / 2 + width / 3 * np.sin(i / 10))
+        cv2.rectangle(frame, (cx - 40, 200), (cx + 40, 280), (40, 80, 220), -1)
+        yield frame
+        i += 1
+
+
+def capture_loop(deliver, seconds, fps):
+    """Produce frames on schedule; returns per-frame time spent in deliver()"""
+    frames = synthetic_frames()
+    costs = []
+    late = 0
+    interval = 1.0 / fps
+    next_time = time.monotonic()
+    end = next_time + seconds
+    while next_time < end:
+        frame = next(frames)
+        start = time.monotonic()
+        deliver(frame)
+        costs.append(time.monotonic() - start)
+        next_time += interval
+        delay = next_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            late += 1
+    return costs, late
+
+
+def report(mode, costs, late):
+    costs_ms = np.array(costs) * 1000
+    print(f"{mode}: capture thread spends {costs_ms.mean():.2f} ms/frame "
+          f"(max {costs_ms.max():.2f}), {late} of {len(costs)} frames late")
+
+
+def run_inline(stages, seconds, fps):
+    functions = [(vision.load_stage(name), {}) for name in stages]
+
+    def deliver(frame):
+        for function, state in functions:
+            function(frame, state)
+
+    costs, late = capture_loop(deliver, seconds, fps)
+    report("inline", costs, late)
+
+
+def run_pipeline(stages, seconds, fps):
+    camera = FakeCamera()
+    pipeline = vision.VisionPipeline(camera, stages).start()
+
+    def deliver(frame):
+        for listener in camera.frame_listeners:
+            listener(frame)
+
+    costs, late = capture_loop(deliver, seconds, fps)
+    time.sleep(0.5)  # Let the workers finish what they have
+    stats = pipeline.stats()
+    pipeline.stop()
+
+    report("pipeline", costs, late)
+    print(f"  {stats['published']} frames published, "
+          f"{stats['skipped_no_slot']} skipped with no free slot")
+    print("  %-20s %10s %8s %18s %18s" % (
+        "stage", "processed", "dropped", "latency ms mean/max", "run ms mean/max"))
+    for name, stage in stats["stages"].items():
+        print("  %-20s %10d %8d %18s %18s" % (
+            name, stage["processed"], stage["dropped"],
+            f"{stage['latency_ms']['mean']}/{stage['latency_ms']['max']}",
+            f"{stage['run_ms']['mean']}/{stage['run_ms']['max']}"))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Capture-thread cost of vision stages')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--fps', type=float, default=30)
+    parser.add_argument('--stages', default='motion,brightness,vision_bench:slow')
+    args = parser.parse_args()
+
+    stages = [name.strip() for name in args.stages.split(',') if name.strip()]
+    print(f"{WIDTH}x{HEIGHT} at {args.fps:g} fps for {args.seconds:g} s, stages: {', '.join(stages)}")
+    run_inline(stages, args.seconds, args.fps)
+    run_pipeline(stages, args.seconds, args.fps)
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# capture_presets.py
+# Named GStreamer capture presets. Scaling, frame-rate limiting and colour
+# conversion happen inside the pipeline (in hardware via nvvidconv on the
+# Jetson), so Python only ever receives frames at the size it will stream.
+#
+# Run "python3 capture_presets.py --benchmark" to measure the capture cost of
+# every preset on whichever source is available.
+import argparse
+import glob
+import os
+import shutil
+import subprocess
+import time
+
+import cv2
+
+# Preset name -> output size and frame rate handed to Python
+PRESETS = {
+    "hd60": {"width": 1280, "height": 720, "framerate": 60},
+    "hd30": {"width": 1280, "height": 720, "framerate": 30},
+    "sd30": {"width": 640, "height": 360, "framerate": 30},
+    "sd15": {"width": 640, "height": 360, "framerate": 15},
+    "low15": {"width": 424, "height": 240, "framerate": 15},
+}
+DEFAULT_PRESET = "sd30"
+
+# The CSI sensor mode we capture at before scaling down
+SENSOR_WIDTH = 1280
+SENSOR_HEIGHT = 720
+SENSOR_FRAMERATE = 60
+
+# Sources in order of preference
+SOURCES = ["argus", "v4l2", "test"]
+
+# Keep only the newest frame so a slow reader never sees stale video
+APPSINK = "appsink drop=true max-buffers=1 sync=false"
+
+
+def gstreamer_pipeline(preset=DEFAULT_PRESET, source="argus", flip_method=0, device="/dev/video0"):
+    """Build the pipeline string for a preset on a source"""
+    p = PRESETS[preset]
+    output_caps = (
+        "video/x-raw, width=(int)%d, height=(int)%d, framerate=(fraction)%d/1"
+        % (p["width"], p["height"], p["framerate"])
+    )
+
+    if source == "argus":
+        # Drop frames while still in NVMM, then let nvvidconv scale and convert
+        # in hardware. videoconvert only has to strip the padding byte of BGRx.
+        return (
+            "nvarguscamerasrc ! "
+            "video/x-raw(memory:NVMM), "
+            "width=(int)%d, height=(int)%d, "
+            "format=(string)NV12, framerate=(fraction)%d/1 ! "
+            "videorate drop-only=true ! "
+            "video/x-raw(memory:NVMM), framerate=(fraction)%d/1 ! "
+            "nvvidconv flip-method=%d ! "
+            "video/x-raw, width=(int)%d, height=(int)%d, format=(string)BGRx ! "
+            "videoconvert ! "
+            "video/x-raw, format=(string)BGR ! %s"
+            % (
+                SENSOR_WIDTH,
+                SENSOR_HEIGHT,
+                SENSOR_FRAMERATE,
+                p["framerate"],
+                flip_method,
+                p["width"],
+                p["height"],
+                APPSINK,
+            )
+        )
+    if source == "v4l2":
+        return (
+            "v4l2src device=%s ! "
+            "decodebin ! "
+            "videorate drop-only=true ! "
+            "videoscale ! "
+            "videoconvert ! "
+            "%s, format=(string)BGR ! %s"
+            % (device, output_caps, APPSINK)
+        )
+    if source == "test":
+        return (
+            "videotestsrc is-live=true pattern=ball ! "
+            "%s ! "
+            "videoconvert ! "
+            "video/x-raw, format=(string)BGR ! %s"
+            % (output_caps, APPSINK)
+        )
+    raise ValueError(f"Unknown capture source: {source}")
+
+
+def gstreamer_element_exists(element):
+    """Ask gst-inspect-1.0 whether a GStreamer element is installed"""
+    inspect = shutil.which("gst-inspect-1.0")
+    if not inspect:
+        return False
+    result = subprocess.run([inspect, element],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return result.returncode == 0
+
+
+def available_sources():
+    """Return the sources that can plausibly be opened on this machine"""
+    sources = []
+    if gstreamer_element_exists("nvarguscamerasrc"):
+        sources.append("argus")
+    if glob.glob("/dev/video*"):
+        sources.append("v4l2")
+    sources.append("test")
+    return sources
+
+
+def choose_preset(source):
+    """Pick the preset for a source, honouring CAPTURE_PRESET if it is set"""
+    preset = os.environ.get("CAPTURE_PRESET")
+    if preset:
+        if preset not in PRESETS:
+            raise ValueError(f"Unknown capture preset: {preset}")
+        return preset
+    # The same for every source: scaling in nvvidconv is free, but the JPEG
+    # encode in Python still costs about four times as much at 1280x720
+    return DEFAULT_PRESET
+
+
+def open_pipeline(pipeline):
+    """Open a pipeline and check that it actually delivers a frame"""
+    camera = cv2.VideoCapture(pipeline, cv2.CAP_GSTREAMER)
+    if camera.isOpened():
+        success, _ = camera.read()
+        if success:
+            return camera
+    camera.release()
+    return None
+
+
+def open_camera(preset=None, flip_method=0, sources=None):
+    """Open the first working source; returns (camera, source, preset)"""
+    for source in sources or available_sources():
+        source_preset = preset or choose_preset(source)
+        pipeline = gstreamer_pipeline(source_preset, source, flip_method)
+        camera = open_pipeline(pipeline)
+        if camera is not None:
+            print(f"Camera opened: source={source} preset={source_preset}")
+            return camera, source, source_preset
+        print(f"Could not open {source} capture, trying the next source")
+    return None, None, None
+
+
+def benchmark(source, frames=120, encode=True):
+    """Measure the cost of getting frames into Python for every preset"""
+    print(f"Benchmarking capture presets on source '{source}' ({frames} frames each)")
+    print("%-8s %10s %10s %10s %12s %12s" % (
+        "preset", "size", "fps", "read ms", "MB/s to py", "encode ms"))
+    for name, p in PRESETS.items():
+        camera = open_pipeline(gstreamer_pipeline(name, source))
+        if camera is None:
+            print("%-8s could not be opened" % name)
+            continue
+        try:
+            # Let the pipeline settle before timing
+            for _ in range(10):
+                camera.read()
+
+            read_time = 0.0
+            encode_time = 0.0
+            frame_bytes = 0
+            start = time.perf_counter()
+            for _ in range(frames):
+                t0 = time.perf_counter()
+                success, frame = camera.read()
+                t1 = time.perf_counter()
+                if not success:
+                    break
+                read_time += t1 - t0
+                frame_bytes += frame.nbytes
+                if encode:
+                    cv2.imencode('.jpg', frame)
+                    encode_time += time.perf_counter() - t1
+            elapsed = time.perf_counter() - start
+        finally:
+            camera.release()
+
+        print("%-8s %10s %10.1f %10.2f %12.1f %12.2f" % (
+            name,
+            "%dx%d" % (p["width"], p["height"]),
+            frames / elapsed,
+            1000 * read_time / frames,
+            frame_bytes / elapsed / 1e6,
+            1000 * encode_time / frames,
+        ))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="GStreamer capture presets")
+    parser.add_argument("--benchmark", action="store_true", help="Benchmark every preset")
+    parser.add_argument("--source", choices=SOURCES, help="Capture source (default: best available)")
+    parser.add_argument("--frames", type=int, default=120, help="Frames to time per preset")
+    parser.add_argument("--no-encode", action="store_true", help="Skip timing JPEG encoding")
+    parser.add_argument("--print", dest="preset", choices=list(PRESETS),
+                        help="Print the pipeline for a preset and exit")
+    args = parser.parse_args()
+
+    source = args.source or available_sources()[0]
+    if args.preset:
+        print(gstreamer_pipeline(args.preset, source))
+    elif args.benchmark:
+        benchmark(source, args.frames, encode=not args.no_encode)
+    else:
+        print(f"Available sources: {', '.join(available_sources())}")
+        print(f"Selected preset for {source}: {choose_preset(source)}")
@@ -0,0 +1,76 @@
+import signal
+
+# Production serving setup
+# gevent's WSGI server runs every request as a greenlet, so an MJPEG viewer
+# costs a few KB of stack instead of an OS thread. Only time.sleep is
+# monkey-patched: capture and encoding threads stay native threads with native
+# locks and queues. Request handlers must never block on those locks for long,
+# so stream viewers sleep on a FrameSignal, which the native threads wake
+# without touching the gevent hub, and anything slow (opening a camera) goes
+# through run_blocking().
+SHUTDOWN_TIMEOUT = 2.0  # Seconds open streams get to finish on SIGTERM
+BACKLOG = 1024
+
+
+def available():
+    try:
+        import gevent  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def patch():
+    """Make time.sleep cooperative; call before any request is served"""
+    from gevent import monkey
+    monkey.patch_time()
+
+
+class FrameSignal:
+    """Wake the greenlets waiting for a stream's next frame, from any thread"""
+
+    def __init__(self):
+        import gevent
+        from gevent.event import Event
+
+        self.new_event = Event
+        self.event = Event()
+        # An async watcher is the one libev primitive that is safe to trigger
+        # from another thread; its callback runs on the hub
+        self.watcher = gevent.get_hub().loop.async_()
+        self.watcher.start(self._wake)
+
+    def notify(self, *args):
+        """Called from capture/encoder threads; takes and ignores their arguments"""
+        self.watcher.send()
+
+    def wait(self, timeout=None):
+        self.event.wait(timeout)
+
+    def _wake(self):
+        event, self.event = self.event, self.new_event()
+        event.set()
+
+
+def run_blocking(function, *args):
+    """Run a blocking call on gevent's thread pool and wait for it cooperatively"""
+    import gevent
+    return gevent.get_hub().threadpool.apply(function, args)
+
+
+def serve(app, host, port):
+    """Serve app with gevent until SIGTERM or SIGINT, then stop accepting
+    connections and end open streams; returns so the caller can clean up"""
+    import gevent
+    from gevent.pywsgi import WSGIServer
+
+    server = WSGIServer((host, port), app, backlog=BACKLOG, log=None)
+
+    def shutdown():
+        print("Shutting down...")
+        # Runs in its own greenlet so the signal handler returns at once
+        gevent.spawn(server.stop, timeout=SHUTDOWN_TIMEOUT)
+
+    gevent.signal_handler(signal.SIGTERM, shutdown)
+    gevent.signal_handler(signal.SIGINT, shutdown)
+    server.serve_forever()
@@ -1,49 +1,27 @@
 # robot_webserver.py
+import argparse
+import signal
+import sys
 from flask import Flask, render_template, Response, jsonify
 import cv2
 import threading
 import time
 import Jetson.GPIO as GPIO  # For controlling motors on Jetson
+import capture_presets
+import serving
 
 # Configuration
 app = Flask(__name__)
 
 # Camera setup
-# gstreamer_pipeline returns a GStreamer pipeline for capturing from the CSI camera
-# Defaults to 1280x720 @ 60fps
+# capture_presets picks the best available source (CSI camera, then V4L2, then
+# videotestsrc) and a preset that scales and rate-limits inside the pipeline,
+# so frames arrive at the size we stream. Set CAPTURE_PRESET to override.
 # Flip the image by setting the flip_method (most common values: 0 and 2)
-# display_width and display_height determine the size of the window on the screen
-
-
-def gstreamer_pipeline(
-    capture_width=1280,
-    capture_height=720,
-    display_width=1280,
-    display_height=720,
-    framerate=60,
-    flip_method=2,
-):
-    return (
-        "nvarguscamerasrc ! "
-        "video/x-raw(memory:NVMM), "
-        "width=(int)%d, height=(int)%d, "
-        "format=(string)NV12, framerate=(fraction)%d/1 ! "
-        "nvvidconv flip-method=%d ! "
-        "video/x-raw, width=(int)%d, height=(int)%d, format=(string)BGRx ! "
-        "videoconvert ! "
-        "video/x-raw, format=(string)BGR ! appsink"
-        % (
-            capture_width,
-            capture_height,
-            framerate,
-            flip_method,
-            display_width,
-            display_height,
-        )
-    )
-
-
-camera = cv2.VideoCapture(gstreamer_pipeline(flip_method=0), cv2.CAP_GSTREAMER)  
+camera, camera_source, camera_preset = capture_presets.open_camera(flip_method=0)
+if camera is None:
+    print("Error: Could not open camera")
+    exit()
 
 
 # Motor control pins setup
@@ -63,17 +41,54 @@ GPIO.setup(MOTOR_B_PIN2, GPIO.OUT)
 # Global variable to store current motor state
 motor_state = {"left": "stop", "right": "stop"}
 
-def generate_frames():
-    """Generate camera frames for streaming"""
-    while True:
+# Frame broadcasting
+# One capture thread reads and encodes; every viewer is sent the latest JPEG,
+# so viewers no longer take turns reading (and stealing frames from) the camera
+frame_condition = threading.Condition()
+latest_jpeg = None
+latest_seq = 0
+capturing = True
+
+# Set when serving with gevent: viewers are greenlets and wait on this
+# instead of blocking on frame_condition (see serving.py)
+frame_signal = None
+
+def capture_frames():
+    """Capture and encode frames on a background thread"""
+    global latest_jpeg, latest_seq
+    # Runs until cleanup() clears capturing; a failed read is retried, since
+    # ending here would end every stream until a restart
+    while capturing:
         success, frame = camera.read()
         if not success:
-            break
-        else:
-            ret, buffer = cv2.imencode('.jpg', frame)
-            frame = buffer.tobytes()
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+            print("Warning: Could not read from camera")
+            time.sleep(0.1)
+            continue
+        ret, buffer = cv2.imencode('.jpg', frame)
+        if not ret:
+            continue
+        with frame_condition:
+            latest_jpeg = buffer.tobytes()
+            latest_seq += 1
+            frame_condition.notify_all()
+        if frame_signal is not None:
+            frame_signal.notify()
+
+def generate_frames():
+    """Generate camera frames for streaming"""
+    last_seq = 0
+    while capturing:
+        if frame_signal is not None and latest_seq == last_seq:
+            frame_signal.wait(2.0)
+        with frame_condition:
+            if frame_signal is None and latest_seq == last_seq:
+                frame_condition.wait(2.0)
+            if latest_seq == last_seq:
+                continue
+            frame, last_seq = latest_jpeg, latest_seq
+        yield b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+        yield frame
+        yield b'\r\n'
 
 def control_motors(left, right):
     """Control both motors based on commands"""
@@ -148,11 +163,37 @@ def status():
 
 def cleanup():
     """Clean up resources"""
+    global capturing
+    capturing = False
+    capture_thread.join(timeout=2.0)
     camera.release()
     GPIO.cleanup()
 
+capture_thread = threading.Thread(target=capture_frames, name='Capture', daemon=True)
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Robot test web server')
+    parser.add_argument('--production', action='store_true',
+                        help='Serve with gevent (one greenlet per viewer instead of a thread)')
+    parser.add_argument('--port', type=int, default=8000, help='Port to listen on')
+    args = parser.parse_args()
+
     try:
-        app.run(host='0.0.0.0', port=8000, threaded=True)
+        if args.production and serving.available():
+            serving.patch()
+            # Created on the main thread, whose hub serves the requests
+            frame_signal = serving.FrameSignal()
+            capture_thread.start()
+            print("Serving with gevent on port %d" % args.port)
+            serving.serve(app, '0.0.0.0', args.port)
+        else:
+            if args.production:
+                print("gevent is not installed (pip3 install gevent); using the dev server")
+            # Exit through the finally below on SIGTERM too, so GPIO is cleaned up
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+            capture_thread.start()
+            app.run(host='0.0.0.0', port=args.port, threaded=True)
+    except KeyboardInterrupt:
+        pass
     finally:
         cleanup()
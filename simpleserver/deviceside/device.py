@@ -1,16 +1,37 @@
 import asyncio
 import json
 import cv2
+import numpy as np
 import websockets
 import argparse
 import os
 from aiortc import RTCPeerConnection, RTCSessionDescription, VideoStreamTrack
 from aiortc.contrib.media import MediaPlayer, MediaRelay
+from outbound import OutboundScheduler, CONTROL, STATE, TELEMETRY
 
 # Configuration - These could be loaded from a config file
 DEFAULT_SERVER_URL = 'ws://localhost:3000/signaling?deviceAuth=your-device-secret-key'
 DEFAULT_DEVICE_ID = 'unique-device-id'
 
+# The controller opens a data channel with this label for motor commands and
+# telemetry. It is created unordered with no retransmits: a late direction
+# command is worse than a lost one, since the next keypress supersedes it.
+CONTROL_CHANNEL_LABEL = 'control'
+# A command stays in effect until another replaces it, so a lost "stop" would
+# leave the robot moving. The controller sends stop on a second, reliable and
+# ordered channel with this label (or through the signaling server).
+RELIABLE_CHANNEL_LABEL = 'control-reliable'
+TELEMETRY_INTERVAL = 1.0  # seconds
+
+def websocket_is_open(websocket):
+    """Check if a websocket is open (works with old and new websockets versions)"""
+    if websocket is None:
+        return False
+    if hasattr(websocket, 'open'):
+        return websocket.open
+    from websockets.protocol import State
+    return websocket.state is State.OPEN
+
 # Custom video track for handling different camera sources
 class CameraVideoTrack(VideoStreamTrack):
     def __init__(self, camera_id=0):
@@ -32,6 +53,12 @@ class CameraVideoTrack(VideoStreamTrack):
         self.task = None
         self.frame = None
         self.last_frame_time = 0
+        
+        # Reused every frame: the camera decodes into bgr and the colour
+        # conversion writes into rgb, so recv() allocates no frame arrays.
+        # VideoFrame.from_ndarray copies rgb, so reusing it is safe.
+        self.bgr = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        self.rgb = np.empty_like(self.bgr)
     
     async def recv(self):
         # If the camera isn't open, try to reopen it
@@ -45,14 +72,19 @@ class CameraVideoTrack(VideoStreamTrack):
                 print(f"Error reopening camera: {e}")
         
         # Capture frame
-        ret, frame = self.cap.read()
+        ret, frame = self.cap.read(self.bgr)
         if not ret:
             print("Warning: Could not read from camera")
             # Return a blank frame as fallback
-            frame = np.zeros((480, 640, 3), dtype=np.uint8)
+            self.bgr[:] = 0
+            frame = self.bgr
+        elif frame is not self.bgr:
+            # The camera changed size; reuse arrays of the new size from now on
+            self.bgr = frame
+            self.rgb = np.empty_like(frame)
         
         # Convert to RGB (aiortc expects RGB format)
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self.rgb)
         
         # Create VideoFrame object
         pts, time_base = await self.next_timestamp()
@@ -129,8 +161,10 @@ class RTCConnection:
     def __init__(self, device_controller, camera_id=0):
         self.pc = None
         self.device_controller = device_controller
-        self.camera_id = camera_id
+        self.camera_id = camera_id  # None to connect without video
         self.video_track = None
+        self.data_channel = None
+        self.reliable_channel = None
     
     async def create_connection(self):
         # Close any existing connection
@@ -141,10 +175,17 @@ class RTCConnection:
         self.pc = RTCPeerConnection()
         
         # Set up video track
-        self.video_track = CameraVideoTrack(self.camera_id)
+        if self.camera_id is not None:
+            self.video_track = CameraVideoTrack(self.camera_id)
+            
+            # Add video track to peer connection
+            self.pc.addTrack(self.video_track)
         
-        # Add video track to peer connection
-        self.pc.addTrack(self.video_track)
+        # Accept the controller's command channels
+        @self.pc.on("datachannel")
+        def on_datachannel(channel):
+            if channel.label in (CONTROL_CHANNEL_LABEL, RELIABLE_CHANNEL_LABEL):
+                self.attach_data_channel(channel)
         
         # Log ICE connection state changes
         @self.pc.on("iceconnectionstatechange")
@@ -156,7 +197,54 @@ class RTCConnection:
         
         return self.pc
     
+    def attach_data_channel(self, channel):
+        print(f"Data channel '{channel.label}' opened")
+        if channel.label == RELIABLE_CHANNEL_LABEL:
+            self.reliable_channel = channel
+        else:
+            self.data_channel = channel
+        
+        @channel.on("message")
+        def on_message(message):
+            try:
+                data = json.loads(message)
+            except ValueError:
+                print(f"Invalid data channel message: {message}")
+                return
+            
+            if data.get("type") == "command":
+                result = self.device_controller.handle_command(data["command"])
+                # Answer on the channel the command came in on, so a
+                # reliable command gets a reliable response
+                if channel.readyState == "open":
+                    channel.send(json.dumps({
+                        "type": "command_response",
+                        "command": data["command"],
+                        "id": data.get("id"),
+                        "result": result
+                    }))
+        
+        @channel.on("close")
+        def on_close():
+            print(f"Data channel '{channel.label}' closed")
+            if self.data_channel is channel:
+                self.data_channel = None
+            if self.reliable_channel is channel:
+                self.reliable_channel = None
+    
+    def channel_open(self):
+        return self.data_channel is not None and self.data_channel.readyState == "open"
+    
+    def send(self, message):
+        """Send a message on the data channel; returns False if it isn't open"""
+        if not self.channel_open():
+            return False
+        self.data_channel.send(json.dumps(message))
+        return True
+    
     async def close_connection(self):
+        self.data_channel = None
+        self.reliable_channel = None
         if self.pc:
             # Close peer connection
             await self.pc.close()
@@ -176,13 +264,19 @@ class DeviceApplication:
         self.device_controller = DeviceController()
         self.rtc_connection = RTCConnection(self.device_controller, camera_id)
         self.websocket = None
+        self.outbound = None
         self.reconnect_task = None
+        self.telemetry_task = None
         self.running = False
+        # Whether the signaling server last said a controller is connected;
+        # telemetry only falls back to signaling while one is
+        self.controller_present = False
     
     async def connect_to_server(self):
         try:
             self.websocket = await websockets.connect(self.server_url)
             print(f"Connected to signaling server: {self.server_url}")
+            self.controller_present = False
             
             # Register with server
             await self.websocket.send(json.dumps({
@@ -191,6 +285,12 @@ class DeviceApplication:
                 "deviceId": self.device_id
             }))
             
+            # Everything else sent to the server goes through a priority queue,
+            # so command responses never wait behind candidates or telemetry
+            if self.outbound:
+                await self.outbound.stop()
+            self.outbound = OutboundScheduler(self.websocket.send).start()
+            
             # Start message handling loop
             await self.handle_messages()
             
@@ -201,6 +301,11 @@ class DeviceApplication:
             print(f"Error connecting to server: {e}")
             await self.schedule_reconnect()
     
+    def signal(self, message, priority):
+        """Queue a message for the signaling server if connected"""
+        if self.outbound and websocket_is_open(self.websocket):
+            self.outbound.put(json.dumps(message), priority)
+    
     async def schedule_reconnect(self):
         # Cancel any existing reconnect task
         if self.reconnect_task:
@@ -224,6 +329,13 @@ class DeviceApplication:
                 if data["type"] == "controller_ready":
                     # Controller is ready to connect
                     print("Controller is ready")
+                    self.controller_present = True
+                    
+                elif data["type"] == "error":
+                    print(f"Server error: {data.get('message')}")
+                    # The server's reply when there was nobody to forward to
+                    if str(data.get("message", "")).startswith("controller for device"):
+                        self.controller_present = False
                     
                 elif data["type"] == "offer":
                     # Handle incoming WebRTC offer
@@ -244,7 +356,7 @@ class DeviceApplication:
             await self.schedule_reconnect()
         except Exception as e:
             print(f"Error handling messages: {e}")
-            if self.websocket and self.websocket.open:
+            if websocket_is_open(self.websocket):
                 await self.websocket.close()
             await self.schedule_reconnect()
     
@@ -256,12 +368,12 @@ class DeviceApplication:
             # Set up ICE candidate handling
             @pc.on("icecandidate")
             async def on_icecandidate(candidate):
-                if candidate and self.websocket and self.websocket.open:
-                    await self.websocket.send(json.dumps({
+                if candidate:
+                    self.signal({
                         "type": "ice_candidate",
                         "deviceId": self.device_id,
                         "candidate": candidate.to_json()
-                    }))
+                    }, STATE)
             
             # Set remote description
             offer = RTCSessionDescription(sdp=data["offer"]["sdp"], type=data["offer"]["type"])
@@ -272,45 +384,65 @@ class DeviceApplication:
             await pc.setLocalDescription(answer)
             
             # Send answer to controller
-            if self.websocket and self.websocket.open:
-                await self.websocket.send(json.dumps({
-                    "type": "answer",
-                    "deviceId": self.device_id,
-                    "answer": {"sdp": pc.localDescription.sdp, "type": pc.localDescription.type}
-                }))
+            self.signal({
+                "type": "answer",
+                "deviceId": self.device_id,
+                "answer": {"sdp": pc.localDescription.sdp, "type": pc.localDescription.type}
+            }, STATE)
         except Exception as e:
             print(f"Error handling offer: {e}")
     
     async def handle_command(self, data):
-        # Process command
+        # Commands arrive here only when the controller has no open data
+        # channel for them; see RTCConnection.attach_data_channel for the
+        # direct path
         result = self.device_controller.handle_command(data["command"])
         
         # Send response
-        if self.websocket and self.websocket.open:
-            await self.websocket.send(json.dumps({
-                "type": "command_response",
-                "deviceId": self.device_id,
-                "command": data["command"],
-                "result": result
-            }))
+        self.signal({
+            "type": "command_response",
+            "deviceId": self.device_id,
+            "command": data["command"],
+            "id": data.get("id"),
+            "result": result
+        }, CONTROL)
+    
+    async def send_telemetry(self):
+        # Telemetry goes over the data channel, or the signaling server if
+        # the channel isn't open but a controller is connected there
+        while self.running:
+            await asyncio.sleep(TELEMETRY_INTERVAL)
+            telemetry = {"type": "telemetry", "telemetry": self.device_controller.get_status()}
+            if self.rtc_connection.send(telemetry) or not self.controller_present:
+                continue
+            telemetry["deviceId"] = self.device_id
+            self.signal(telemetry, TELEMETRY)
     
     async def run(self):
         self.running = True
+        self.telemetry_task = asyncio.create_task(self.send_telemetry())
         await self.connect_to_server()
     
     async def stop(self):
         self.running = False
         
-        # Cancel reconnect task if active
+        # Cancel reconnect and telemetry tasks if active
         if self.reconnect_task:
             self.reconnect_task.cancel()
             self.reconnect_task = None
+        if self.telemetry_task:
+            self.telemetry_task.cancel()
+            self.telemetry_task = None
         
         # Close WebRTC connection
         await self.rtc_connection.close_connection()
         
+        if self.outbound:
+            await self.outbound.stop()
+            self.outbound = None
+        
         # Close WebSocket
-        if self.websocket and self.websocket.open:
+        if websocket_is_open(self.websocket):
             await self.websocket.close()
 
 # Main function
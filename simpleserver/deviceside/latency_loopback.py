@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# latency_loopback.py - compare command round-trip over signaling vs data channel
+# Runs everything on this machine: the Python signaling relay, a DeviceApplication
+# without a camera, and a controller peer. The controller first times commands
+# sent through the relay, then opens the 'control' data channel and times the
+# same commands sent peer-to-peer.
+#
+# On loopback there is no network distance, so this mostly compares the
+# processing cost of each path. Use --hop-delay to add the one-way delay of
+# reaching a remote signaling server to every message the relay forwards.
+#
+#   python3 latency_loopback.py --commands 200 --hop-delay 20
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+
+import websockets
+from aiortc import RTCPeerConnection, RTCSessionDescription
+
+import device
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'signaling'))
+import relay  # noqa: E402
+
+DEVICE_ID = 'loopback-device'
+
+
+class DelayedRelay(relay.SignalingRelay):
+    """A relay that holds each forwarded message to emulate a remote server"""
+
+    def __init__(self, hop_delay):
+        super().__init__()
+        self.hop_delay = hop_delay
+
+    async def forward(self, websocket, role, device_id, message):
+        # Both legs (client -> server -> peer) cross the network
+        await asyncio.sleep(2 * self.hop_delay)
+        await super().forward(websocket, role, device_id, message)
+
+
+def summarize(name, latencies):
+    latencies = sorted(latencies)
+    return (f"{name:<14} n={len(latencies):<5} "
+            f"median {statistics.median(latencies) * 1000:6.2f} ms  "
+            f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:6.2f} ms  "
+            f"max {latencies[-1] * 1000:6.2f} ms")
+
+
+async def time_signaling(websocket, commands):
+    latencies = []
+    for i in range(commands):
+        sent = time.perf_counter()
+        await websocket.send(json.dumps({
+            "type": "command", "deviceId": DEVICE_ID, "command": "status", "id": i
+        }))
+        while True:
+            data = json.loads(await websocket.recv())
+            if data["type"] == "command_response" and data.get("id") == i:
+                latencies.append(time.perf_counter() - sent)
+                break
+    return latencies
+
+
+async def time_data_channel(channel, responses, commands, timeout=1.0):
+    latencies = []
+    lost = 0
+    for i in range(commands):
+        response = asyncio.get_event_loop().create_future()
+        responses[i] = response
+        sent = time.perf_counter()
+        channel.send(json.dumps({"type": "command", "command": "status", "id": i}))
+        try:
+            await asyncio.wait_for(response, timeout)
+            latencies.append(time.perf_counter() - sent)
+        except asyncio.TimeoutError:
+            # The channel doesn't retransmit, so a lost command stays lost
+            lost += 1
+    return latencies, lost
+
+
+async def connect_controller(url):
+    headers = {"Cookie": "connect.sid=loopback"}
+    try:
+        return await websockets.connect(url, additional_headers=headers)
+    except TypeError:
+        # websockets < 14 names the argument extra_headers
+        return await websockets.connect(url, extra_headers=headers)
+
+
+async def main(commands, hop_delay):
+    signaling_relay = DelayedRelay(hop_delay)
+    server = await websockets.serve(signaling_relay.handler, "127.0.0.1", 0)
+    port = next(iter(server.sockets)).getsockname()[1]
+    url = f"ws://127.0.0.1:{port}/signaling"
+
+    app = device.DeviceApplication(f"{url}?deviceAuth={relay.DEFAULT_DEVICE_SECRET}",
+                                   DEVICE_ID, camera_id=None)
+    device_task = asyncio.ensure_future(app.run())
+
+    websocket = await connect_controller(url)
+    await websocket.send(json.dumps({
+        "type": "register", "role": "controller", "deviceId": DEVICE_ID
+    }))
+    while json.loads(await websocket.recv())["type"] != "device_ready":
+        pass
+
+    # 1. Commands through the signaling relay
+    signaling_latencies = await time_signaling(websocket, commands)
+
+    # 2. Commands over the data channel, set up the same way the web app does
+    pc = RTCPeerConnection()
+    channel = pc.createDataChannel(device.CONTROL_CHANNEL_LABEL, ordered=False, maxRetransmits=0)
+    opened = asyncio.Event()
+    responses = {}
+
+    @channel.on("open")
+    def on_open():
+        opened.set()
+
+    @channel.on("message")
+    def on_message(message):
+        data = json.loads(message)
+        response = responses.pop(data.get("id"), None)
+        if data["type"] == "command_response" and response and not response.done():
+            response.set_result(data)
+
+    await pc.setLocalDescription(await pc.createOffer())
+    await websocket.send(json.dumps({
+        "type": "offer",
+        "deviceId": DEVICE_ID,
+        "offer": {"sdp": pc.localDescription.sdp, "type": pc.localDescription.type}
+    }))
+    while True:
+        data = json.loads(await websocket.recv())
+        if data["type"] == "answer":
+            break
+    await pc.setRemoteDescription(RTCSessionDescription(**data["answer"]))
+    await asyncio.wait_for(opened.wait(), 10)
+
+    channel_latencies, lost = await time_data_channel(channel, responses, commands)
+
+    await pc.close()
+    await websocket.close()
+    await app.stop()
+    device_task.cancel()
+    server.close()
+    await server.wait_closed()
+    return signaling_latencies, channel_latencies, lost
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Command latency: signaling relay vs data channel')
+    parser.add_argument('--commands', type=int, default=200, help='Commands to time on each path')
+    parser.add_argument('--hop-delay', type=float, default=0,
+                        help='One-way delay to the signaling server in ms')
+    parser.add_argument('--verbose', action='store_true', help='Show device output')
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with output:
+        signaling_latencies, channel_latencies, lost = asyncio.run(main(args.commands, args.hop_delay / 1000))
+
+    print(summarize("signaling", signaling_latencies))
+    print(summarize("data channel", channel_latencies) + f"  lost {lost}")
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# loadtest.py - simulate a fleet of devices against the signaling relay
+# Starts relay.py in-process (or targets --url), connects N devices and one
+# controller per device, then has every controller send commands that its
+# device answers with command_response. Reports connect time, round-trip
+# latency and messages per second.
+#
+#   python3 loadtest.py --devices 2000 --commands 20
+import argparse
+import asyncio
+import json
+import logging
+import resource
+import statistics
+import time
+
+import websockets
+
+import relay
+
+
+async def run_device(url, device_id, ready):
+    """A fake device that answers every command"""
+    async with websockets.connect(url, compression=None, max_queue=None) as websocket:
+        await websocket.send(json.dumps({
+            "type": "register", "role": "device", "deviceId": device_id
+        }))
+        ready.set()
+        async for message in websocket:
+            data = json.loads(message)
+            if data["type"] == "command":
+                await websocket.send(json.dumps({
+                    "type": "command_response",
+                    "deviceId": device_id,
+                    "command": data["command"],
+                    "result": {"status": "success", "sent": data["sent"]},
+                }))
+
+
+async def run_controller(url, device_id, commands, interval, latencies):
+    """A fake controller that sends commands and times the responses"""
+    headers = {"Cookie": "connect.sid=loadtest"}
+    try:
+        connection = websockets.connect(url, compression=None, additional_headers=headers)
+    except TypeError:
+        # websockets < 14 names the argument extra_headers
+        connection = websockets.connect(url, compression=None, extra_headers=headers)
+    async with connection as websocket:
+        await websocket.send(json.dumps({
+            "type": "register", "role": "controller", "deviceId": device_id
+        }))
+        # Wait until the relay pairs us with the device
+        while json.loads(await websocket.recv())["type"] != "device_ready":
+            pass
+
+        for _ in range(commands):
+            await websocket.send(json.dumps({
+                "type": "command", "deviceId": device_id,
+                "command": "forward", "sent": time.perf_counter(),
+            }))
+            while True:
+                data = json.loads(await websocket.recv())
+                if data["type"] == "command_response":
+                    latencies.append(time.perf_counter() - data["result"]["sent"])
+                    break
+            await asyncio.sleep(interval)
+
+
+def raise_file_limit():
+    """Each simulated connection needs two sockets in this process"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+
+async def main(args):
+    server = None
+    signaling_relay = None
+    url = args.url
+    if url is None:
+        signaling_relay = relay.SignalingRelay()
+        server = await websockets.serve(signaling_relay.handler, "127.0.0.1", 0,
+                                        compression=None, max_queue=None)
+        port = next(iter(server.sockets)).getsockname()[1]
+        url = f"ws://127.0.0.1:{port}/signaling"
+    device_url = f"{url}?deviceAuth={args.device_secret}"
+
+    # Connect the fleet in batches so the listen backlog isn't overrun
+    print(f"Connecting {args.devices} devices...")
+    start = time.perf_counter()
+    device_tasks = []
+    for batch in range(0, args.devices, args.batch):
+        events = []
+        for i in range(batch, min(batch + args.batch, args.devices)):
+            ready = asyncio.Event()
+            events.append(ready)
+            device_tasks.append(asyncio.ensure_future(run_device(device_url, f"device-{i}", ready)))
+        await asyncio.gather(*(event.wait() for event in events))
+    connect_time = time.perf_counter() - start
+    print(f"Connected {args.devices} devices in {connect_time:.2f} s")
+
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        run_controller(url, f"device-{i}", args.commands, args.interval, latencies)
+        for i in range(args.devices)
+    ))
+    elapsed = time.perf_counter() - start
+
+    if signaling_relay:
+        devices, controllers = signaling_relay.connection_count()
+        print(f"Relay index: {devices} devices, {controllers} controllers still connected")
+
+    for task in device_tasks:
+        task.cancel()
+    await asyncio.gather(*device_tasks, return_exceptions=True)
+    if server:
+        server.close()
+        await server.wait_closed()
+
+    latencies.sort()
+    messages = 2 * len(latencies)  # each command and its response pass through the relay
+    print(f"Round trips: {len(latencies)} in {elapsed:.2f} s "
+          f"({messages / elapsed:.0f} relayed messages/s)")
+    print(f"Latency ms: median {statistics.median(latencies) * 1000:.2f}, "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.2f}, "
+          f"max {latencies[-1] * 1000:.2f}")
+    print(f"Peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB "
+          f"(relay and simulated clients together)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Signaling relay load test')
+    parser.add_argument('--url', help='Relay to test (default: start one in-process)')
+    parser.add_argument('--devices', type=int, default=1000, help='Number of simulated devices')
+    parser.add_argument('--commands', type=int, default=10, help='Commands per controller')
+    parser.add_argument('--interval', type=float, default=0.1, help='Seconds between commands')
+    parser.add_argument('--batch', type=int, default=100, help='Devices connected at a time')
+    parser.add_argument('--device-secret', default=relay.DEFAULT_DEVICE_SECRET)
+    args = parser.parse_args()
+
+    logging.getLogger('SignalingRelay').setLevel(logging.WARNING)
+    logging.getLogger('websockets').setLevel(logging.WARNING)
+    limit = raise_file_limit()
+    if limit < 4 * args.devices + 64:
+        print(f"Warning: open file limit {limit} may be too low for {args.devices} devices")
+    relay.use_uvloop()
+    asyncio.run(main(args))
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# relay.py - asyncio signaling relay
+# Speaks the same protocol as webside/server.js (register / offer / answer /
+# ice_candidate / command / command_response) so device.py and the web app can
+# use it unchanged:
+#
+#   python3 relay.py --port 3001 --device-secret your-device-secret-key
+#
+# All devices share one index of device id -> {device, controllers}. A message
+# is routed by the role of the connection it came from: a device's messages go
+# to its controllers, a controller's messages go to its device. Apart from
+# "register" the relay only reads the routing header (the "type" at the start
+# of the message) and forwards the original message untouched.
+import argparse
+import asyncio
+import json
+import logging
+import re
+from urllib.parse import parse_qs, urlparse
+
+import websockets
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('SignalingRelay')
+
+DEFAULT_HOST = '0.0.0.0'
+DEFAULT_PORT = 3001
+DEFAULT_DEVICE_SECRET = 'your-device-secret-key'  # Same key as server.js
+
+# The routing header is looked for in the first bytes of a message only. Every
+# sender puts "type" first, so an SDP or candidate body is never scanned.
+HEADER_SCAN = 128
+TYPE_PATTERN = re.compile(r'"type"\s*:\s*"([^"]*)"')
+
+
+def message_type(message):
+    """Return the message type without decoding the rest of the message"""
+    head = message[:HEADER_SCAN]
+    if isinstance(head, bytes):
+        head = head.decode('utf-8', 'ignore')
+    match = TYPE_PATTERN.search(head)
+    if match:
+        return match.group(1)
+    # Unusual key order; fall back to a full parse
+    data = json.loads(message)
+    if not isinstance(data, dict):
+        raise ValueError("message is not a JSON object")
+    return data.get('type')
+
+
+def session_cookie(header):
+    """Return the connect.sid cookie from a Cookie header, parsed like server.js"""
+    for cookie in (header or '').split(';'):
+        name, separator, value = cookie.partition('=')
+        if separator and name.strip() == 'connect.sid':
+            return value.strip()
+    return None
+
+
+def error_message(text):
+    return json.dumps({"type": "error", "message": text})
+
+
+class DevicePeers:
+    """The device and the controllers connected for one device id"""
+    __slots__ = ('device', 'controllers')
+
+    def __init__(self):
+        self.device = None
+        self.controllers = set()
+
+
+class SignalingRelay:
+    def __init__(self, device_secret=DEFAULT_DEVICE_SECRET):
+        self.device_secret = device_secret
+        self.devices = {}  # device id -> DevicePeers
+
+    def connection_count(self):
+        devices = sum(1 for peers in self.devices.values() if peers.device)
+        controllers = sum(len(peers.controllers) for peers in self.devices.values())
+        return devices, controllers
+
+    async def handler(self, websocket, path=None):
+        """Handle one connection (older websockets versions also pass path)"""
+        if path is None:
+            path = websocket.request.path
+            headers = websocket.request.headers
+        else:
+            headers = websocket.request_headers
+        query = parse_qs(urlparse(path).query)
+        device_auth = query.get('deviceAuth', [None])[0]
+
+        # Same rule as server.js: a session cookie or a device key is required
+        if not session_cookie(headers.get('Cookie')) and device_auth is None:
+            await websocket.send(error_message('Authentication required'))
+            await websocket.close()
+            return
+
+        role = None
+        device_id = None
+        try:
+            async for message in websocket:
+                try:
+                    kind = message_type(message)
+                except ValueError:
+                    await websocket.send(error_message('Invalid message format'))
+                    continue
+
+                if kind == 'register':
+                    if role is not None:
+                        self.unregister(websocket, role, device_id)
+                    role, device_id = await self.register(websocket, message, device_auth)
+                    continue
+
+                if role is None:
+                    await websocket.send(error_message('Register before sending messages'))
+                    continue
+
+                await self.forward(websocket, role, device_id, message)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            if role is not None:
+                self.unregister(websocket, role, device_id)
+
+    async def register(self, websocket, message, device_auth):
+        """Add a connection to the index; returns (role, device id)"""
+        try:
+            data = json.loads(message)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            await websocket.send(error_message('Invalid message format'))
+            return None, None
+        role = data.get('role')
+        device_id = data.get('deviceId')
+        valid_id = isinstance(device_id, (str, int)) and not isinstance(device_id, bool)
+        if role not in ('device', 'controller') or not valid_id or not device_id:
+            await websocket.send(error_message('Invalid registration'))
+            return None, None
+        # server.js builds its keys by string concatenation, so 1 and "1" are
+        # the same device there
+        device_id = str(device_id)
+        # Check the key before touching the index, so a rejected device
+        # never leaves an entry behind
+        if role == 'device' and device_auth != self.device_secret:
+            await websocket.send(error_message('Device authentication failed'))
+            return None, None
+
+        peers = self.devices.get(device_id)
+        if peers is None:
+            peers = self.devices[device_id] = DevicePeers()
+
+        if role == 'device':
+            peers.device = websocket
+        else:
+            peers.controllers.add(websocket)
+        logger.info(f"Registered {role} for device {device_id}")
+
+        # If both sides are connected, notify them
+        if peers.device and peers.controllers:
+            await peers.device.send('{"type": "controller_ready"}')
+            if role == 'device':
+                for controller in list(peers.controllers):
+                    await controller.send('{"type": "device_ready"}')
+            else:
+                await websocket.send('{"type": "device_ready"}')
+        return role, device_id
+
+    def unregister(self, websocket, role, device_id):
+        peers = self.devices.get(device_id)
+        if peers is None:
+            return
+        if role == 'device' and peers.device is websocket:
+            peers.device = None
+        else:
+            peers.controllers.discard(websocket)
+        if peers.device is None and not peers.controllers:
+            del self.devices[device_id]
+        logger.info(f"Client {role}-{device_id} disconnected")
+
+    async def forward(self, websocket, role, device_id, message):
+        """Forward a message unchanged to the other side of its device"""
+        peers = self.devices.get(device_id)
+        if role == 'controller':
+            target = peers.device if peers else None
+            if target is None:
+                await websocket.send(error_message(f"device for device {device_id} not connected"))
+                return
+            try:
+                await target.send(message)
+            except websockets.exceptions.ConnectionClosed:
+                pass
+        else:
+            if not peers or not peers.controllers:
+                await websocket.send(error_message(f"controller for device {device_id} not connected"))
+                return
+            for controller in list(peers.controllers):
+                try:
+                    await controller.send(message)
+                except websockets.exceptions.ConnectionClosed:
+                    pass
+
+
+async def main(host, port, device_secret):
+    relay = SignalingRelay(device_secret)
+    logger.info(f"Starting signaling relay on {host}:{port}")
+    # Compression costs CPU per message and buys little for small JSON
+    async with websockets.serve(relay.handler, host, port, compression=None):
+        await asyncio.Future()  # Run forever
+
+
+def use_uvloop():
+    """Use uvloop when it is installed; it roughly doubles messages per second"""
+    try:
+        import uvloop
+    except ImportError:
+        return
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='WebRTC signaling relay')
+    parser.add_argument('--host', default=DEFAULT_HOST, help='Interface to listen on')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Port to listen on')
+    parser.add_argument('--device-secret', default=DEFAULT_DEVICE_SECRET,
+                        help='Key devices must pass as ?deviceAuth=')
+    args = parser.parse_args()
+
+    use_uvloop()
+    try:
+        asyncio.run(main(args.host, args.port, args.device_secret))
+    except KeyboardInterrupt:
+        logger.info("Relay stopped by user")